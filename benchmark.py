@@ -0,0 +1,364 @@
+#%% Imports
+
+import os
+import json
+import time
+import tempfile
+import argparse
+import platform
+import subprocess
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+import datetime as dt
+from unittest import mock
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import prefect_run
+import resources
+import bigquery_client
+import smtplib
+import revenue_data
+import dash_aggregates
+import dash_views
+import dash_charts
+import dash_format
+import dash_tables
+import dash_render
+import dash_images
+import dash_config
+import dash_store
+from browser_session import BrowserSession
+
+
+# Rough row count of v_dashboard_revenue today, scale 1 generates this many rows.
+BASE_ROWS = 250_000
+SCALES = [1, 10, 100]
+RESULTS_FILE = 'benchmark_results.jsonl'
+
+# Covers the prior year and the current year, which is everything the dashboard reads.
+HISTORY_START = '2023-01-01'
+
+
+#%% Synthetic Data
+
+def synthetic_categories(n_categories):
+    return [f'Category {i + 1:02d}' for i in range(n_categories)]
+
+
+# effective_date / new_category / amount rows with a few large categories, a long tail and some refunds.
+def synthetic_revenue(n_rows, n_categories=8, start=HISTORY_START, end=None, seed=0):
+    rng = np.random.default_rng(seed)
+    end = pd.Timestamp(end or dt.date.today()) - pd.Timedelta(days=1)
+    days = pd.date_range(start, end, freq='D')
+    categories = np.array(synthetic_categories(n_categories))
+
+    weights = 1 / np.arange(1, n_categories + 1)
+    amount = rng.lognormal(mean=5, sigma=1.2, size=n_rows).round(2)
+    amount[rng.random(n_rows) < 0.03] *= -1
+
+    df = pd.DataFrame({
+        'effective_date': days[rng.integers(0, len(days), n_rows)],
+        'new_category': categories[rng.choice(n_categories, n_rows, p=weights / weights.sum())],
+        'amount': amount,
+    })
+    return df.sort_values('effective_date', ignore_index=True)
+
+
+#%% Stubs
+
+# Stands in for the BigQuery connection: every query returns the synthetic table, the aggregation filters the dates itself.
+class BenchSQL:
+    def __init__(self, df):
+        self.df = df
+        self.table = pa.Table.from_pandas(df.assign(effective_date=df['effective_date'].dt.date), preserve_index=False)
+        self.client = self
+
+    def __call__(self, service_account_info):
+        return self
+
+    def read(self, sql):
+        return self.df.copy()
+
+    def query(self, sql):
+        return self
+
+    def to_arrow(self, create_bqstorage_client=False):
+        return self.table
+
+    def result(self, page_size=None):
+        self.page_size = page_size
+        return self
+
+    def to_arrow_iterable(self):
+        return iter(self.table.to_batches(max_chunksize=self.page_size))
+
+
+class BenchSecret:
+    values = {
+        'bbg-bigquery-sa': {'type': 'service_account'},
+        'email-gmail': {'EMAIL_UID': 'bench@example.com', 'EMAIL_PWD': 'bench'},
+    }
+
+    def __init__(self, name):
+        self.name = name
+
+    @classmethod
+    def load(cls, name):
+        return cls(name)
+
+    def get(self):
+        return self.values[self.name]
+
+
+def bench_variables(cat_list):
+    values = {
+        'cash_dash_categories': {'CAT_LIST': ','.join(cat_list)},
+        'email_fail_notifications': {'EMAIL_FAIL': 'bench@example.com'},
+        'email_cash_dash': {'EMAIL_SEND': 'bench@example.com'},
+    }
+    return lambda name, default=None: values.get(name, default)
+
+
+# Accepts the login and every message like Gmail would, but never opens a socket. Records the message size.
+class BenchSMTP:
+    size = None
+
+    def __init__(self, host, port, timeout=None):
+        pass
+
+    def login(self, user, password):
+        return (235, b'Accepted')
+
+    def sendmail(self, from_addr, to_addrs, msg):
+        BenchSMTP.size = len(msg)
+        return {}
+
+    def quit(self):
+        pass
+
+    def close(self):
+        pass
+
+
+#%% Benchmark
+
+class StageTimer:
+    def __init__(self):
+        self.stages = {}
+
+    def __call__(self, name):
+        return _Stage(self.stages, name)
+
+
+class _Stage:
+    def __init__(self, stages, name):
+        self.stages, self.name = stages, name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stages[self.name] = self.stages.get(self.name, 0) + time.perf_counter() - self.start
+        return False
+
+
+@contextmanager
+def bench_stubs(df, cat_list):
+    patches = [
+        mock.patch.object(bigquery_client, 'MemorySQL', BenchSQL(df)),
+        mock.patch.object(resources, 'Secret', BenchSecret),
+        mock.patch.object(resources.Variable, 'get', bench_variables(cat_list)),
+        mock.patch.object(smtplib, 'SMTP_SSL', BenchSMTP),
+    ]
+    for p in patches:
+        p.start()
+    resources.clear()
+    try:
+        yield
+    finally:
+        for p in patches:
+            p.stop()
+        resources.clear()
+
+
+# Runs each stage of run_email_cash_dash_task in order against the stubs and times it on its own.
+def run_pipeline(df, cat_list, aggregate_mode='pandas', renderer=dash_tables.DEFAULT_TABLE_RENDERER, as_of=None):
+    timer = StageTimer()
+    report_date = as_of or dt.date.today()
+    eom, recent_date, peom = dash_views.dash_dates(report_date)
+    budget_year = report_date.year - 1
+    artifacts = {}
+
+    with bench_stubs(df, cat_list):
+        con = prefect_run.get_bigquery_con()
+        if aggregate_mode == 'store':
+            # A warm store as a daily run finds it, then the restatement window upserted and the periods queried.
+            with tempfile.TemporaryDirectory() as store_dir:
+                store = dash_store.DailyStore(os.path.join(store_dir, 'daily_revenue.sqlite'))
+                df_daily = dash_store.daily_totals(df)
+                cutoff = df_daily['effective_date'].max() - pd.Timedelta(days=dash_config.RESTATEMENT_DAYS)
+                store.upsert_days(df_daily[df_daily['effective_date'] < cutoff])
+                with timer('store_refresh'):
+                    store.upsert_days(df_daily[df_daily['effective_date'] >= cutoff], cutoff)
+                with timer('aggregate'):
+                    df_day, df_month = store.aggregates(eom, budget_year, end=as_of)
+        elif aggregate_mode == 'streaming':
+            with timer('load_aggregate'):
+                df_day, df_month = dash_aggregates.aggregate_streaming(con, eom, budget_year, end=as_of)
+        else:
+            with timer('load'):
+                df_raw = revenue_data.read_revenue(con, compact=True)
+            with timer('aggregate'):
+                df_day, df_month = dash_aggregates.aggregate_pandas(df_raw, eom, budget_year, end=as_of)
+
+        with timer('views'):
+            views = dash_views.build_views(df_day, df_month, eom, recent_date, peom, budget_year, cat_list)
+
+        with timer('day_chart'):
+            artifacts['day_chart'] = dash_charts.day_chart(views['day_total'], views['day_budget'], dash_images.IMAGE_WIDTH_PX)
+        with timer('month_chart'):
+            artifacts['month_chart'] = dash_charts.month_chart(views['month_total'], views['month_budget'], dash_images.IMAGE_WIDTH_PX)
+
+        tables = {name: spec for name, spec in dash_render.DASH_ARTIFACTS.items() if spec['kind'] == 'table'}
+        with timer('format'):
+            displays = {name: dash_format.display_frame(views[spec['view']], cat_list + ['Total'], spec['zero_as_dash'])
+                        for name, spec in tables.items()}
+
+        if renderer == 'html':
+            with BrowserSession() as browser:
+                with timer('browser_start'):
+                    browser.start()
+                for name, spec in tables.items():
+                    with timer('styler_html'):
+                        html = dash_tables.table_html(displays[name], dash_render.caption(name, views))
+                    with timer('screenshot'):
+                        artifacts[name] = browser.screenshot(html, name)
+        else:
+            for name, spec in tables.items():
+                with timer('raster'):
+                    artifacts[name] = dash_tables.render_table(displays[name], dash_render.caption(name, views), renderer=renderer)
+
+        with timer('optimize_images'):
+            optimized, report = dash_render.optimize_dashboard({name: artifacts[name] for name in dash_render.DASH_ARTIFACTS})
+
+        with timer('email'):
+            prefect_run.send_dash_email.fn(optimized, report_date)
+
+    timer.stages['total'] = sum(timer.stages.values())
+    image_bytes = {'before': sum(row['before_bytes'] for row in report), 'after': sum(row['after_bytes'] for row in report)}
+    return timer.stages, BenchSMTP.size, image_bytes
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# Best of repeat runs per stage, appended as one JSON line per scale so runs from different commits line up.
+def benchmark(scales=SCALES, n_categories=8, base_rows=BASE_ROWS, repeat=3, aggregate_mode='pandas'
+              , renderer=dash_tables.DEFAULT_TABLE_RENDERER, results_file=RESULTS_FILE, as_of=None):
+    cat_list = synthetic_categories(n_categories)
+    results = []
+    for scale in scales:
+        n_rows = int(base_rows * scale)
+        df = synthetic_revenue(n_rows, n_categories, end=as_of)
+        runs = []
+        for _ in range(repeat):
+            stages, email_bytes, image_bytes = run_pipeline(df, cat_list, aggregate_mode, renderer, as_of)
+            runs.append(stages)
+
+        result = {
+            'timestamp': dt.datetime.now().isoformat(timespec='seconds'),
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'scale': scale,
+            'rows': n_rows,
+            'categories': n_categories,
+            'aggregate_mode': aggregate_mode,
+            'renderer': renderer,
+            'repeat': repeat,
+            'email_bytes': email_bytes,
+            'image_bytes': image_bytes,
+            'seconds': {stage: round(min(run[stage] for run in runs), 4) for stage in runs[0]},
+        }
+        results.append(result)
+        with open(results_file, 'a') as f:
+            f.write(json.dumps(result) + '\n')
+        print(f"scale {scale}x ({n_rows:,} rows): " + ', '.join(f"{k} {v:.3f}s" for k, v in result['seconds'].items()))
+        print(f"    images {image_bytes['before'] / 1024:,.0f} KB -> {image_bytes['after'] / 1024:,.0f} KB, email {(email_bytes or 0) / 1024:,.0f} KB")
+    return results
+
+
+# Segment fan-out the way the flow runs it: one aggregate, every segment's views from one cube, then each
+# segment rendered, optimized and sent on a bounded pool. Shows how total time grows with the segment count.
+def fan_out(df, cat_list, n_segments, renderer='raster', max_workers=dash_config.MAX_WORKERS, as_of=None):
+    timer = StageTimer()
+    report_date = as_of or dt.date.today()
+    eom, recent_date, peom = dash_views.dash_dates(report_date)
+    budget_year = report_date.year - 1
+    segments = {i: ([cat_list[i % len(cat_list)], cat_list[(i + 1) % len(cat_list)]], True, dash_config.DEFAULT_COMPARISON) for i in range(n_segments)}
+
+    with bench_stubs(df, cat_list):
+        with timer('aggregate'):
+            df_day, df_month = dash_aggregates.aggregate_pandas(df, eom, budget_year, end=as_of)
+        with timer('views'):
+            views = dash_views.layout_views(df_day, df_month, eom, recent_date, peom, budget_year, segments)
+
+        def segment(i, browser=None):
+            artifacts = {name: dash_render.render_artifact(name, views[i], segments[i][0], renderer, browser) for name in dash_render.DASH_ARTIFACTS}
+            optimized, _ = dash_render.optimize_dashboard(artifacts)
+            prefect_run.send_dash_email.fn(optimized, report_date, report_name=f'segment_{i}')
+
+        with timer('render_send'):
+            with BrowserSession() as browser, ThreadPoolExecutor(max_workers=max_workers) as pool:
+                list(pool.map(lambda i: segment(i, browser if renderer == 'html' else None), segments))
+
+    timer.stages['total'] = sum(timer.stages.values())
+    return timer.stages
+
+
+def benchmark_fan_out(segment_counts, n_categories=8, base_rows=BASE_ROWS, renderer='raster', results_file=RESULTS_FILE, as_of=None):
+    cat_list = synthetic_categories(n_categories)
+    df = synthetic_revenue(base_rows, n_categories, end=as_of)
+    results = []
+    for n_segments in segment_counts:
+        stages = fan_out(df, cat_list, n_segments, renderer, as_of=as_of)
+        result = {
+            'timestamp': dt.datetime.now().isoformat(timespec='seconds'),
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'segments': n_segments,
+            'rows': base_rows,
+            'renderer': renderer,
+            'max_workers': dash_config.MAX_WORKERS,
+            'seconds': {stage: round(v, 4) for stage, v in stages.items()},
+        }
+        results.append(result)
+        with open(results_file, 'a') as f:
+            f.write(json.dumps(result) + '\n')
+        print(f"{n_segments} segments: " + ', '.join(f"{k} {v:.3f}s" for k, v in result['seconds'].items())
+              + f", {stages['total'] / n_segments:.3f}s per segment")
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Time each stage of the cash dash against synthetic data.')
+    parser.add_argument('--scales', type=float, nargs='+', default=SCALES)
+    parser.add_argument('--categories', type=int, default=8)
+    parser.add_argument('--base-rows', type=int, default=BASE_ROWS)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--aggregate-mode', choices=['pandas', 'streaming', 'store'], default='pandas')
+    parser.add_argument('--renderer', choices=dash_tables.TABLE_RENDERERS, default=dash_tables.DEFAULT_TABLE_RENDERER)
+    parser.add_argument('--as-of', type=dt.date.fromisoformat, default=None)
+    parser.add_argument('--output', default=RESULTS_FILE)
+    parser.add_argument('--segments', type=int, nargs='+', default=None, help='benchmark segment fan-out at these segment counts instead')
+    args = parser.parse_args()
+
+    if args.segments:
+        benchmark_fan_out(args.segments, args.categories, args.base_rows, args.renderer, os.path.abspath(args.output), args.as_of)
+    else:
+        benchmark([int(s) if s == int(s) else s for s in args.scales], args.categories, args.base_rows, args.repeat
+              , args.aggregate_mode, args.renderer, os.path.abspath(args.output), args.as_of)
@@ -0,0 +1,15 @@
+#%% Imports
+
+from dbharbor.bigquery import SQL
+from google.cloud import bigquery
+from google.oauth2 import service_account
+
+
+#%% Client
+
+# dbharbor's SQL reads its credentials from a file named in GOOGLE_APPLICATION_CREDENTIALS,
+# this builds the same client straight from the secret's service account info.
+class MemorySQL(SQL):
+    def __init__(self, service_account_info):
+        credentials = service_account.Credentials.from_service_account_info(service_account_info)
+        self.client = bigquery.Client(credentials=credentials, project=service_account_info.get('project_id'))
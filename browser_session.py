@@ -0,0 +1,118 @@
+#%% Imports
+
+import os
+import shutil
+import tempfile
+import threading
+from urllib.parse import quote
+from dwebdriver import ChromeDriver
+import dash_metrics
+
+
+# Chromium profile prewarm.py launched once at image build. Sessions start from a private copy of it, so the
+# first-launch profile setup is already done and concurrent sessions never contend for one profile's lock.
+CHROME_PROFILE = os.getenv('CASH_DASH_CHROME_PROFILE')
+CHROMIUM_BINARY = os.getenv('CASH_DASH_CHROMIUM', '/usr/bin/chromium')
+CHROMEDRIVER = os.getenv('CASH_DASH_CHROMEDRIVER', '/usr/bin/chromedriver')
+
+
+#%% Prewarmed Profile
+
+# Same headless Chromium as dwebdriver's ChromeDriver, started through selenium so it can take --user-data-dir.
+class ProfileDriver:
+    def __init__(self, profile, window_size='1920,1080'):
+        self.profile = profile
+        self.window_size = window_size
+        self.user_data_dir = None
+        self.driver = None
+
+    def __enter__(self):
+        from selenium import webdriver
+        from selenium.webdriver.chrome.service import Service
+
+        self.user_data_dir = tempfile.mkdtemp(prefix='cash_dash_chrome_')
+        shutil.copytree(self.profile, self.user_data_dir, dirs_exist_ok=True)
+        options = webdriver.ChromeOptions()
+        options.binary_location = CHROMIUM_BINARY
+        for arg in ['--headless=new', '--no-sandbox', '--disable-dev-shm-usage', f'--window-size={self.window_size}', f'--user-data-dir={self.user_data_dir}']:
+            options.add_argument(arg)
+        try:
+            self.driver = webdriver.Chrome(service=Service(CHROMEDRIVER), options=options)
+        except BaseException:
+            shutil.rmtree(self.user_data_dir, ignore_errors=True)
+            raise
+        return self.driver
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            self.driver.quit()
+        finally:
+            shutil.rmtree(self.user_data_dir, ignore_errors=True)
+        return False
+
+
+def chrome_driver(window_size):
+    if CHROME_PROFILE and os.path.isdir(CHROME_PROFILE):
+        return ProfileDriver(CHROME_PROFILE, window_size)
+    return ChromeDriver(no_sandbox=True, window_size=window_size, use_chromium=True, headless=True)
+
+
+#%% Browser Session
+
+# Chromium is launched on the first screenshot and reused for every table until the session exits.
+class BrowserSession:
+    def __init__(self, window_size='1920,1080'):
+        self.window_size = window_size
+        self._chrome = None
+        self.driver = None
+        self._lock = threading.RLock()
+
+    def __enter__(self):
+        return self
+
+    def start(self):
+        with self._lock:
+            if self.driver is None:
+                with dash_metrics.span('browser_start'):
+                    chrome = chrome_driver(self.window_size)
+                    self.driver = chrome.__enter__()
+                    self._chrome = chrome
+            return self.driver
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        with self._lock:
+            chrome, self._chrome, self.driver = self._chrome, None, None
+            if chrome is not None:
+                chrome.__exit__(exc_type, exc_value, traceback)
+        return False
+
+    # Render tasks share the session from worker threads, so each capture holds the lock for the whole page load.
+    # The page is loaded from a data: URL and the table comes back as PNG bytes, nothing touches the disk.
+    def screenshot(self, html, name='table'):
+        with self._lock:
+            driver = self.start()
+            with dash_metrics.span('screenshot_' + name):
+                driver.get('data:text/html;charset=utf-8,' + quote(html))
+                chart = driver.find_element(by='xpath', value='/html/body/table')
+                return chart.screenshot_as_png
+
+
+#%% Run Sessions
+
+# One browser per flow run, so concurrent runs in a served process never share or close each other's browser.
+_run_sessions = {}
+_run_lock = threading.Lock()
+
+
+def shared_session(run_key=None):
+    with _run_lock:
+        if run_key not in _run_sessions:
+            _run_sessions[run_key] = BrowserSession()
+        return _run_sessions[run_key]
+
+
+def close_shared_session(run_key=None):
+    with _run_lock:
+        session = _run_sessions.pop(run_key, None)
+    if session is not None:
+        session.__exit__(None, None, None)
@@ -2,32 +2,154 @@
 
 from prefect import get_client
 from prefect.client.schemas.filters import FlowRunFilter, DeploymentFilter
+from prefect.events.clients import get_events_subscriber
+from prefect.events.filters import EventFilter, EventNameFilter, EventOccurredFilter, EventRelatedFilter
+from prefect.events.schemas.events import ResourceSpecification
+import datetime as dt
 import asyncio
+import time
 # import pandas as pd
 
-async def get_data_status():
-    async with get_client() as client:
-            
-        flow_runs = await client.read_flow_runs(
-            limit=1,
-            sort="START_TIME_DESC",
-            deployment_filter=DeploymentFilter(name={'any_': ["dbt-analytics-master"]}),
-            flow_run_filter=FlowRunFilter(state={"name": {"any_": ["Completed", "Failed", "Crashed", "TimedOut"]}})
-        )
-
-        # print(flow_runs[0])
-
-        # states = []
-        # for run in flow_runs:
-            # print(f"Flow run {run.id} state: {run.state.name}, start time: {run.start_time}")
-        #     states.append(run.state.name)
-        # df = pd.DataFrame(states, columns=['state'])
-        # print(df['state'].value_counts())
-        if not flow_runs[0].state.is_completed():
-            return False
-        else:
-            return True
+
+DBT_DEPLOYMENTS = ['dbt-analytics-master']
+TERMINAL_STATES = ["Completed", "Failed", "Crashed", "TimedOut"]
+
+# A signal that hasn't answered within this many seconds counts as not ready for this check.
+SIGNAL_TIMEOUT = 20
+
+# Polling backoff in seconds while waiting for the dbt run, a finished-run event cuts any wait short.
+POLL_INITIAL = 15
+POLL_MAX = 300
+POLL_FACTOR = 2
+
+
+#%% Signals
+
+# Ready when the newest terminal run of the deployment completed and, if not_before is given, started at or after it.
+async def deployment_status(client, deployment, not_before=None):
+    flow_runs = await client.read_flow_runs(
+        limit=1,
+        sort="START_TIME_DESC",
+        deployment_filter=DeploymentFilter(name={'any_': [deployment]}),
+        flow_run_filter=FlowRunFilter(state={"name": {"any_": TERMINAL_STATES}})
+    )
+    if not flow_runs:
+        return False, 'no finished runs'
+    run = flow_runs[0]
+    if not run.state.is_completed():
+        return False, f'latest run {run.state.name}'
+    if not_before is not None and (run.start_time is None or run.start_time < not_before):
+        return False, f'latest run started {run.start_time}'
+    return True, f'completed run started {run.start_time}'
+
+
+# Table metadata only, no scan: 'project.dataset.table' checks last modified, a '#partition' suffix
+# checks the newest partition of a date-partitioned table covers the day before not_before.
+def table_status(bq_client, table_spec, not_before=None):
+    table_id, _, kind = table_spec.partition('#')
+    if kind == 'partition':
+        project, dataset, table = table_id.split('.')
+        rows = bq_client.query(f"""
+        SELECT MAX(partition_id) AS partition_id
+        FROM `{project}.{dataset}.INFORMATION_SCHEMA.PARTITIONS`
+        WHERE table_name = '{table}'
+            AND partition_id NOT IN ('__NULL__', '__UNPARTITIONED__');
+        """).result()
+        partition_id = next(iter(rows)).partition_id
+        if partition_id is None:
+            return False, 'no partitions'
+        latest = dt.datetime.strptime(partition_id[:8], '%Y%m%d').date()
+        expected = (not_before or dt.datetime.now(dt.timezone.utc)).date() - dt.timedelta(days=1)
+        return latest >= expected, f'latest partition {latest}'
+
+    table = bq_client.get_table(table_id)
+    if table.table_type == 'VIEW':
+        return False, 'views have no data modified time, list the base table'
+    ready = not_before is None or table.modified >= not_before
+    return ready, f'modified {table.modified}'
+
+
+async def timed_signal(name, check, timeout):
+    try:
+        ready, detail = await asyncio.wait_for(check, timeout=timeout)
+    except asyncio.TimeoutError:
+        ready, detail = False, f'no answer within {timeout}s'
+    except Exception as e:
+        ready, detail = False, f'{type(e).__name__}: {e}'
+    return {'signal': name, 'ready': ready, 'detail': detail}
+
+
+# Checks every upstream signal at once on shared clients and returns one result per signal.
+async def check_freshness(client, not_before=None, deployments=DBT_DEPLOYMENTS, tables=(), bq_client=None, timeout=SIGNAL_TIMEOUT):
+    checks = [timed_signal(f'deployment {d}', deployment_status(client, d, not_before), timeout) for d in deployments]
+    checks += [timed_signal(f'table {t}', asyncio.to_thread(table_status, bq_client, t, not_before), timeout) for t in tables]
+    return await asyncio.gather(*checks)
+
+
+async def get_data_status(not_before=None, deployments=DBT_DEPLOYMENTS, tables=(), bq_client=None, client=None):
+    if client is None:
+        async with get_client() as client:
+            return await get_data_status(not_before, deployments, tables, bq_client, client)
+
+    results = await check_freshness(client, not_before, deployments, tables, bq_client)
+    for result in results:
+        if not result['ready']:
+            print(f"Not ready: {result['signal']} ({result['detail']})")
+    return all(result['ready'] for result in results)
+
+
+#%% Waiter
+
+# Sets wake whenever an upstream flow run reaches a terminal state, so the waiter re-checks straight away.
+async def watch_runs(wake, deadline, deployments=DBT_DEPLOYMENTS):
+    event_filter = EventFilter(
+        occurred=EventOccurredFilter(since=dt.datetime.now(dt.timezone.utc), until=deadline),
+        event=EventNameFilter(name=[f"prefect.flow-run.{state}" for state in TERMINAL_STATES]),
+        related=EventRelatedFilter(labels=ResourceSpecification({
+            'prefect.resource.role': 'deployment',
+            'prefect.resource.name': list(deployments),
+        })),
+    )
+    try:
+        async with get_events_subscriber(filter=event_filter) as subscriber:
+            async for event in subscriber:
+                print(f"Received {event.event} from an upstream deployment")
+                wake.set()
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        print(f"Unable to subscribe to upstream run events, polling only: {e}")
+
+
+# Polls with exponential backoff until every signal is ready or the deadline passes.
+async def wait_for_data(deadline, not_before=None, deployments=DBT_DEPLOYMENTS, tables=(), bq_client=None
+                        , poll_initial=POLL_INITIAL, poll_max=POLL_MAX, poll_factor=POLL_FACTOR):
+    wake = asyncio.Event()
+    watcher = asyncio.create_task(watch_runs(wake, deadline, deployments))
+    delay = poll_initial
+    start = time.monotonic()
+    try:
+        async with get_client() as client:
+            while True:
+                if await get_data_status(not_before, deployments, tables, bq_client, client):
+                    print(f"Data is ready after waiting {time.monotonic() - start:.0f}s")
+                    return True
+
+                remaining = (deadline - dt.datetime.now(dt.timezone.utc)).total_seconds()
+                if remaining <= 0:
+                    return False
+
+                wait = min(delay, remaining)
+                print(f"Data is not ready, checking again in {wait:.0f}s")
+                try:
+                    await asyncio.wait_for(wake.wait(), timeout=wait)
+                except asyncio.TimeoutError:
+                    delay = min(delay * poll_factor, poll_max)
+                wake.clear()
+    finally:
+        watcher.cancel()
+        await asyncio.gather(watcher, return_exceptions=True)
 
 
 if __name__ == "__main__":
-    asyncio.run(get_data_status())
\ No newline at end of file
+    asyncio.run(get_data_status())
@@ -0,0 +1,189 @@
+#%% Imports
+
+import pandas as pd
+import pyarrow as pa
+import revenue_data
+
+
+AGGREGATE_MODES = ['store', 'pandas', 'bigquery', 'streaming', 'compare']
+
+STREAM_PAGE_SIZE = 100_000
+
+
+#%% Periods
+
+# end is the exclusive as-of cutoff for historical runs; rows on or after it are ignored.
+# current_only leaves out the prior-year month and budget year, for runs that already have them cached.
+def dash_periods(eom, budget_year, end=None, current_only=False):
+    recent_date = pd.Timestamp(eom.year, eom.month, 1)
+    peom = pd.Timestamp(eom) + pd.offsets.MonthEnd(-12)
+    return {
+        'recent_date': recent_date,
+        'prior_start': None if current_only else pd.Timestamp(peom.year, peom.month, 1),
+        'prior_end': None if current_only else peom,
+        'years': [eom.year] if current_only else sorted({eom.year, budget_year}),
+        'end': None if end is None else pd.Timestamp(end),
+    }
+
+
+def in_days(dates, p):
+    mask = dates >= p['recent_date']
+    if p['prior_start'] is not None:
+        mask |= (dates >= p['prior_start']) & (dates <= p['prior_end'])
+    return mask
+
+
+def days_sql(p):
+    sql = f"effective_date >= '{p['recent_date']:%Y-%m-%d}'"
+    if p['prior_start'] is not None:
+        sql += f"\n        OR effective_date BETWEEN '{p['prior_start']:%Y-%m-%d}' AND '{p['prior_end']:%Y-%m-%d}'"
+    return sql
+
+
+def before_end(df, p):
+    return df if p['end'] is None else df[df['effective_date'] < p['end']]
+
+
+def end_sql(p):
+    return '' if p['end'] is None else f"effective_date < '{p['end']:%Y-%m-%d}'"
+
+
+#%% Pandas
+
+def aggregate_pandas(df, eom, budget_year, end=None, current_only=False):
+    if 'amount_cents' in df.columns:
+        return aggregate_compact(df, eom, budget_year, end, current_only)
+
+    p = dash_periods(eom, budget_year, end, current_only)
+    df = before_end(df, p)
+
+    df_day = df[in_days(df['effective_date'], p)].groupby(['effective_date', 'new_category'], as_index=False)['amount'].sum()
+
+    df_month = df[df['effective_date'].dt.year.isin(p['years'])]
+    df_month = df_month.groupby([df_month['effective_date'].dt.to_period('M').rename('yrmnth'), 'new_category'])['amount'].sum()
+    df_month = df_month.reset_index()
+
+    return df_day, df_month
+
+
+# Same aggregates from the compact layout: sums integer cents and groups on month_key instead of Periods.
+def compact_partials(df, p):
+    df = before_end(df, p)
+    day = df[in_days(df['effective_date'], p)].groupby(['effective_date', df['new_category'].astype(str)], observed=True)['amount_cents'].sum()
+
+    in_month = (df['month_key'] // 12).isin(p['years'])
+    month = df[in_month].groupby(['month_key', df['new_category'].astype(str)], observed=True)['amount_cents'].sum()
+
+    return day, month
+
+
+def finalize_partials(day, month):
+    df_day = day.rename('amount').reset_index()
+    df_month = month.rename('amount').reset_index()
+    df_month.insert(0, 'yrmnth', revenue_data.month_key_to_period(df_month.pop('month_key')))
+
+    for df_agg in [df_day, df_month]:
+        df_agg['amount'] = df_agg['amount'] / 100
+
+    return df_day, df_month
+
+
+def aggregate_compact(df, eom, budget_year, end=None, current_only=False):
+    return finalize_partials(*compact_partials(df, dash_periods(eom, budget_year, end, current_only)))
+
+
+#%% Streaming
+
+# Folds each Arrow record batch into running day and month accumulators, so peak memory is
+# bounded by the number of output cells rather than the number of input rows.
+def aggregate_streaming(con, eom, budget_year, page_size=STREAM_PAGE_SIZE, end=None, current_only=False):
+    p = dash_periods(eom, budget_year, end, current_only)
+    start = min(d for d in [p['prior_start'], pd.Timestamp(min(p['years']), 1, 1)] if d is not None)
+    where = f"WHERE effective_date >= '{start:%Y-%m-%d}'"
+    if p['end'] is not None:
+        where += f" AND {end_sql(p)}"
+
+    rows = con.client.query(revenue_data.revenue_sql(where)).result(page_size=page_size)
+
+    day, month, n_rows = None, None, 0
+    for batch in rows.to_arrow_iterable():
+        n_rows += batch.num_rows
+        df = revenue_data.compact_revenue(pa.Table.from_batches([batch])).to_pandas(date_as_object=False)
+        df['effective_date'] = pd.to_datetime(df['effective_date'])
+        batch_day, batch_month = compact_partials(df, p)
+        day = batch_day if day is None else day.add(batch_day, fill_value=0)
+        month = batch_month if month is None else month.add(batch_month, fill_value=0)
+
+    if day is None:
+        raise ValueError('revenue query returned no rows')
+
+    print(f"Revenue streamed: {n_rows:,} rows into {len(day) + len(month):,} cells")
+    return finalize_partials(day.astype('int64'), month.astype('int64'))
+
+
+#%% BigQuery
+
+def aggregate_bigquery(con, eom, budget_year, end=None, current_only=False):
+    p = dash_periods(eom, budget_year, end, current_only)
+    and_end = f"AND {end_sql(p)}" if p['end'] is not None else ''
+
+    df_day = con.read(f"""
+    SELECT effective_date
+        , new_category
+        , SUM(amount) AS amount
+    FROM `{revenue_data.REVENUE_TABLE}`
+    WHERE ({days_sql(p)})
+        {and_end}
+    GROUP BY effective_date, new_category;
+    """)
+    df_day['effective_date'] = pd.to_datetime(df_day['effective_date'])
+    df_day = df_day.sort_values(['effective_date', 'new_category'], ignore_index=True)
+
+    df_month = con.read(f"""
+    SELECT EXTRACT(YEAR FROM effective_date) AS yr
+        , EXTRACT(MONTH FROM effective_date) AS mnth
+        , new_category
+        , SUM(amount) AS amount
+    FROM `{revenue_data.REVENUE_TABLE}`
+    WHERE EXTRACT(YEAR FROM effective_date) IN ({', '.join(str(y) for y in p['years'])})
+        {and_end}
+    GROUP BY yr, mnth, new_category;
+    """)
+    df_month['yrmnth'] = pd.to_datetime(pd.DataFrame({'year': df_month['yr'], 'month': df_month['mnth'], 'day': 1})).dt.to_period('M')
+    df_month = df_month[['yrmnth', 'new_category', 'amount']].sort_values(['yrmnth', 'new_category'], ignore_index=True)
+
+    return df_day, df_month
+
+
+#%% Compare
+
+def compare_aggregates(left, right, keys, tolerance=0.005):
+    merged = pd.merge(left, right, on=keys, how='outer', suffixes=('_left', '_right'))
+    merged = merged.fillna({'amount_left': 0, 'amount_right': 0})
+    merged['diff'] = (merged['amount_left'] - merged['amount_right']).abs()
+    return merged[merged['diff'] > tolerance]
+
+
+# store is a refreshed dash_store.DailyStore, read_raw returns the raw revenue rows.
+def read_aggregates(con, eom, budget_year, mode='pandas', read_raw=None, end=None, current_only=False, store=None):
+    if mode not in AGGREGATE_MODES:
+        raise ValueError(f'aggregate mode is invalid, please choose between ({", ".join(AGGREGATE_MODES)})')
+
+    if mode == 'store':
+        return store.aggregates(eom, budget_year, end, current_only)
+
+    if mode == 'bigquery':
+        return aggregate_bigquery(con, eom, budget_year, end, current_only)
+    if mode == 'streaming':
+        return aggregate_streaming(con, eom, budget_year, end=end, current_only=current_only)
+
+    df_day, df_month = aggregate_pandas(read_raw(), eom, budget_year, end, current_only)
+    if mode == 'compare':
+        bq_day, bq_month = aggregate_bigquery(con, eom, budget_year, end, current_only)
+        bad_day = compare_aggregates(df_day, bq_day, ['effective_date', 'new_category'])
+        bad_month = compare_aggregates(df_month, bq_month, ['yrmnth', 'new_category'])
+        print(f"Aggregate compare: {len(bad_day)} daily and {len(bad_month)} monthly cells differ")
+        if len(bad_day) > 0 or len(bad_month) > 0:
+            print(bad_day.head(20))
+            print(bad_month.head(20))
+    return df_day, df_month
@@ -0,0 +1,50 @@
+#%% Imports
+
+import os
+import multiprocessing
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+import dash_aggregates
+import dash_views
+import dash_render
+from browser_session import BrowserSession
+
+
+#%% Functions
+
+# Only rows before as_of count, so a backfilled day shows what the email would have shown then.
+def report_views(df, as_of, cat_list):
+    eom, recent_date, peom = dash_views.dash_dates(as_of)
+    budget_year = as_of.year - 1
+    df_day, df_month = dash_aggregates.aggregate_pandas(df, eom, budget_year, end=as_of)
+    return dash_views.build_views(df_day, df_month, eom, recent_date, peom, budget_year, cat_list)
+
+
+# Runs in a worker process: one browser per worker, reused for every day in its chunk.
+def render_days(days_views, output_dir, cat_list, table_renderers):
+    filepaths = {}
+    with BrowserSession() as browser:
+        for as_of, views in days_views:
+            day_dir = os.path.join(output_dir, as_of.strftime('%Y-%m-%d'))
+            artifacts = dash_render.render_dashboard(views, cat_list, table_renderers, browser)
+            filepaths[as_of.strftime('%Y-%m-%d')] = dash_render.write_artifacts(artifacts, day_dir)
+            print(f"Rendered {day_dir}")
+    return filepaths
+
+
+def backfill(df, start, end, output_dir, cat_list, table_renderers=None, max_workers=None):
+    days = [d.date() for d in pd.date_range(start, end, freq='D')]
+    if not days:
+        return {}
+    days_views = [(as_of, report_views(df, as_of, cat_list)) for as_of in days]
+
+    max_workers = min(max_workers or os.cpu_count() or 1, len(days))
+    chunks = [days_views[i::max_workers] for i in range(max_workers)]
+
+    filepaths = {}
+    # Spawned, not forked: a worker forked from a flow run inherits the Prefect engine's threads and locks and never exits.
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+        futures = [pool.submit(render_days, chunk, output_dir, cat_list, table_renderers) for chunk in chunks]
+        for future in futures:
+            filepaths.update(future.result())
+    return dict(sorted(filepaths.items()))
@@ -0,0 +1,88 @@
+#%% Imports
+
+import io
+import matplotlib
+# Containers have no display, pin the non-interactive backend before anything can load pyplot.
+matplotlib.use('Agg')
+from matplotlib.figure import Figure
+from matplotlib.dates import date2num
+
+
+# Charts are drawn on their own Figure rather than through pyplot, so they can render on worker threads,
+# and come back as PNG bytes rather than files. With width_px the dpi is picked so the image is exactly that wide.
+def png_bytes(fig, width_px=None):
+    buf = io.BytesIO()
+    dpi = width_px / fig.get_figwidth() if width_px else 'figure'
+    fig.savefig(buf, format='png', dpi=dpi, metadata={'Software': None})
+    return buf.getvalue()
+
+
+#%% Daily Chart
+
+def day_chart(daily, budget, width_px=None, label='Prior Year'):
+    x = date2num(daily.index)
+    budget = [budget] * len(daily)
+
+    # Daily Bars
+    fig = Figure(figsize=(10, 4.8))
+    ax = fig.subplots()
+    ax.bar(x, height=daily, label='Daily Total')
+    for i, y in enumerate(daily):
+        ax.annotate('{:,.0f}'.format(y*1e-3), (x[i], y), ha='center', va='bottom')
+
+    # Cumulative Line
+    ax.plot(x, daily.cumsum(), color='black', label='MTD Total')
+    i, y = list(enumerate(daily.cumsum()))[-1]
+    ax.annotate('{:,.1f}M'.format(y*1e-6), (x[i], y), ha='left', va='center')
+
+    ax.plot(x, budget, color='red', ls='--', label=label)
+    i, y = list(enumerate(budget))[0]
+    ax.annotate('{:,.1f}M'.format(y*1e-6), (x[i], y), ha='right', va='center', color='red')
+
+    # Formatting
+    ax.set_title('Current Month Cash', loc='center')
+    ax.set_xlabel('Day')
+    ax.set_ylabel("Dollars in thousands")
+    ax.legend(loc='best')
+
+    ax.yaxis.set_major_formatter(lambda x, pos: '{:,.0f}'.format(x*1e-3))
+    ax.xaxis_date()
+    fig.autofmt_xdate()
+    fig.tight_layout()
+
+    return png_bytes(fig, width_px)
+
+
+#%% Monthly Chart
+
+def month_chart(monthly, budget, width_px=None, label='Prior Year'):
+    x = monthly.index.astype(str)
+
+    fig = Figure()
+    ax = fig.subplots()
+
+    # Monthly Bars
+    ax.bar(x, monthly, label='Monthly Total')
+    for i, y in enumerate(monthly):
+        ax.annotate('{:,.1f}'.format(y*1e-6), (x[i], y), ha='center', va='bottom')
+
+    # Cumulative Line
+    ax.plot(x, monthly.cumsum(), color='black', label='YTD Total')
+    i, y = list(enumerate(monthly.cumsum()))[-1]
+    ax.annotate('{:,.1f}'.format(y*1e-6), (x[i], y), ha='left', va='center')
+
+    # Budget Line
+    ax.plot(x, budget, color='red', ls='--', label=label)
+    i, y = list(enumerate(budget))[-1]
+    ax.annotate('{:,.1f}'.format(y*1e-6), (x[i], y), ha='left', va='center', color='red')
+
+    ax.set_title('Cash by Month', loc='center')
+    ax.set_ylabel('Dollars in millions')
+    ax.set_xlabel('Month')
+    ax.legend(loc='best')
+
+    ax.yaxis.set_major_formatter(lambda x, pos: '{:,.0f}'.format(x*1e-6))
+    ax.tick_params(axis='x', labelrotation=45)
+    fig.tight_layout()
+
+    return png_bytes(fig, width_px)
@@ -0,0 +1,120 @@
+#%% Imports
+
+import os
+import pandas as pd
+import revenue_data
+import dash_aggregates
+
+
+# {year} is filled in with the year being reported on.
+BUDGET_TABLE = os.getenv('CASH_DASH_BUDGET_TABLE', 'bbg-platform.analytics_stage.fct_budget_{year}')
+
+# One parquet file per baseline and frame.
+BASELINE_CACHE_DIR = os.getenv('CASH_DASH_BASELINE_CACHE_DIR', os.path.join(revenue_data.CACHE_DIR, 'baselines'))
+
+# Where each comparison's baseline comes from, and what the tables and charts call it.
+COMPARISON_SOURCES = {'prior_month': 'prior_year', 'prior_year_to_date': 'prior_year', 'budget': 'budget'}
+COMPARISON_LABELS = {'prior_month': 'Prior Year', 'prior_year_to_date': 'Prior Year', 'budget': 'Budget'}
+
+
+#%% Calendar
+
+# Same calendar day `years` later for a whole index at once; Feb 29 lands on Feb 28.
+def shift_years(dates, years):
+    return pd.DatetimeIndex(dates) + pd.DateOffset(years=years)
+
+
+# Comparison side of the views: the month the MTD table and day chart compare against, as one amount per
+# category, and the months the YTD table and month chart compare against, one row per month. through is
+# the last day the current side has data for.
+def comparison(cube, mode, eom, peom, budget_year, through):
+    if mode == 'budget':
+        return cube.month_of(eom.year, eom, budget=True).sum(axis=0), cube.months_through(eom.year, eom, budget=True)
+
+    month = cube.month_of(budget_year, peom).sum(axis=0)
+    months = cube.months_through(budget_year, peom)
+    if mode == 'prior_year_to_date':
+        days = cube.month_days(peom)
+        month = days[shift_years(days.index, eom.year - peom.year) <= pd.Timestamp(through)].sum(axis=0)
+        period = pd.Period(peom, freq='M')
+        months = pd.concat([months[months.index != period], month.to_frame(period).T])
+    return month, months
+
+
+#%% Sources
+
+def read_budget(con, year):
+    df_budget = con.read(f"""
+    SELECT eom
+        , category_budget AS new_category
+        , SUM(amount) AS amount
+    FROM `{BUDGET_TABLE.format(year=year)}`
+    WHERE EXTRACT(YEAR FROM eom) = {year}
+    GROUP BY eom, category_budget;
+    """)
+    df_budget['yrmnth'] = pd.to_datetime(df_budget['eom']).dt.to_period('M')
+    return df_budget[['yrmnth', 'new_category', 'amount']].sort_values(['yrmnth', 'new_category'], ignore_index=True)
+
+
+# Rows of the aggregates the prior-year comparisons read: the prior-year month by day and the budget year
+# up to that month by month. All of it is closed by the time it is compared against.
+def split_prior_year(df_day, df_month, eom, budget_year):
+    peom = pd.Timestamp(eom) + pd.offsets.MonthEnd(-12)
+    in_day = df_day['effective_date'] <= peom
+    month_ends = df_month['yrmnth'].dt.to_timestamp(how='end').dt.normalize()
+    in_month = (df_month['yrmnth'].dt.year == budget_year) & (month_ends <= peom)
+    return df_day[in_day], df_month[in_month]
+
+
+#%% Cache
+
+def baseline_path(name, frame, cache_dir=BASELINE_CACHE_DIR):
+    return os.path.join(cache_dir, f'{name}.{frame}.parquet')
+
+
+def load_baseline(name, frames, cache_dir=BASELINE_CACHE_DIR):
+    loaded = []
+    for frame in frames:
+        try:
+            df = pd.read_parquet(baseline_path(name, frame, cache_dir))
+        except FileNotFoundError:
+            return None
+        if 'yrmnth' in df.columns:
+            df['yrmnth'] = df['yrmnth'].dt.to_period('M')
+        loaded.append(df)
+    return loaded
+
+
+# Parquet has no Period type, so months are stored as their first day.
+def store_baseline(name, frames, cache_dir=BASELINE_CACHE_DIR):
+    for frame, df in frames.items():
+        if 'yrmnth' in df.columns:
+            df = df.assign(yrmnth=df['yrmnth'].dt.to_timestamp())
+        revenue_data.save_cache(df, baseline_path(name, frame, cache_dir))
+
+
+# Aggregates for one period, with the prior-year side read from the baseline cache when an earlier run in the
+# same period stored it, so only the current month and year are aggregated.
+def read_aggregates(con, eom, budget_year, mode='pandas', read_raw=None, end=None, use_cache=True, store=None):
+    name = f'prior_year_{eom:%Y-%m}_{budget_year}'
+    cached = load_baseline(name, ['day', 'month']) if use_cache else None
+    if cached is None:
+        df_day, df_month = dash_aggregates.read_aggregates(con, eom, budget_year, mode=mode, read_raw=read_raw, end=end, store=store)
+        if use_cache:
+            store_baseline(name, dict(zip(['day', 'month'], split_prior_year(df_day, df_month, eom, budget_year))))
+        return df_day, df_month
+
+    print(f"Baseline cache hit {name}")
+    df_day, df_month = dash_aggregates.read_aggregates(con, eom, budget_year, mode=mode, read_raw=read_raw, end=end, current_only=True, store=store)
+    return pd.concat([cached[0], df_day], ignore_index=True), pd.concat([cached[1], df_month], ignore_index=True)
+
+
+def read_budget_cached(con, year, use_cache=True):
+    name = f'budget_{year}'
+    cached = load_baseline(name, ['month']) if use_cache else None
+    if cached is not None:
+        return cached[0]
+    df_budget = read_budget(con, year)
+    if use_cache:
+        store_baseline(name, {'month': df_budget})
+    return df_budget
@@ -0,0 +1,26 @@
+#%% Imports
+
+import os
+
+
+# Settings the flow signatures need at import time, kept here so prefect_run doesn't have to
+# load pandas, pyarrow or matplotlib before the readiness check.
+
+# Days before the watermark that are re-read every run to pick up restated rows.
+RESTATEMENT_DAYS = 7
+
+TABLE_RENDERERS = ['html', 'raster']
+
+# Selects the renderer for every table unless the task overrides it per table.
+DEFAULT_TABLE_RENDERER = os.getenv('CASH_DASH_TABLE_RENDERER', 'html')
+
+# Worker threads shared by every render, optimize and send task in a run, however many reports or segments it fans out to.
+MAX_WORKERS = int(os.getenv('CASH_DASH_MAX_WORKERS', '6'))
+
+# Total KB of all images in one email after optimization.
+EMAIL_BUDGET_KB = float(os.getenv('CASH_DASH_EMAIL_BUDGET_KB', '1024'))
+
+# What the MTD and YTD tables and charts compare against: the whole prior-year month, the prior year to the
+# same day, or the budget table. Reports can pick their own.
+COMPARISONS = ['prior_month', 'prior_year_to_date', 'budget']
+DEFAULT_COMPARISON = os.getenv('CASH_DASH_COMPARISON', 'prior_month')
@@ -0,0 +1,182 @@
+#%% Imports
+
+import os
+import time
+import smtplib
+import threading
+from email.message import EmailMessage
+from email.utils import make_msgid, formatdate
+from concurrent.futures import ThreadPoolExecutor
+import dash_metrics
+
+
+SMTP_HOST = os.getenv('CASH_DASH_SMTP_HOST', 'smtp.gmail.com')
+SMTP_PORT = int(os.getenv('CASH_DASH_SMTP_PORT', '465'))
+SMTP_TIMEOUT = 60
+
+# Envelope recipients per SMTP transaction, kept well under Gmail's per-message recipient limit.
+BATCH_SIZE = int(os.getenv('CASH_DASH_EMAIL_BATCH_SIZE', '50'))
+
+# Authenticated connections sending batches side by side. Gmail throttles many parallel logins, keep this small.
+CONNECTIONS = int(os.getenv('CASH_DASH_EMAIL_CONNECTIONS', '1'))
+
+# Attempts per batch and the backoff in seconds between them.
+SEND_ATTEMPTS = 4
+BACKOFF_INITIAL = 5
+BACKOFF_MAX = 120
+BACKOFF_FACTOR = 3
+
+
+#%% Message
+
+def split_addresses(addresses):
+    if isinstance(addresses, str):
+        addresses = addresses.replace(';', ',').split(',')
+    return [a.strip() for a in addresses if a and a.strip()]
+
+
+# Built and serialized once, every batch sends the same bytes. Lines that name an artifact become inline images.
+def build_message(artifacts, body, subject, sender, to):
+    msg = EmailMessage()
+    msg['Subject'] = subject
+    msg['From'] = sender
+    msg['To'] = ', '.join(split_addresses(to))
+    msg['Date'] = formatdate(localtime=True)
+    msg['Message-ID'] = make_msgid()
+
+    cids = {name: make_msgid() for name in artifacts}
+    html = []
+    for line in body:
+        if line in artifacts:
+            html.append(f'<img src="cid:{cids[line][1:-1]}">')
+        else:
+            html.append(f'<p>{line}</p>' if line else '<br>')
+
+    msg.set_content('\n'.join(line for line in body if line not in artifacts))
+    msg.add_alternative('<html><body>' + '\n'.join(html) + '</body></html>', subtype='html')
+    html_part = msg.get_payload()[1]
+    for name, png in artifacts.items():
+        html_part.add_related(png, 'image', 'png', cid=cids[name], filename=name + '.png', disposition='inline')
+    return msg.as_bytes()
+
+
+def batches(recipients, size=BATCH_SIZE):
+    return [recipients[i:i + size] for i in range(0, len(recipients), size)]
+
+
+#%% Delivery
+
+# 4xx replies, dropped connections and socket errors are worth another attempt, 5xx replies and bad logins are not.
+def is_transient(error):
+    if isinstance(error, smtplib.SMTPAuthenticationError):
+        return False
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(400 <= code < 500 for code, _ in error.recipients.values())
+    if isinstance(error, smtplib.SMTPResponseException):
+        return 400 <= error.smtp_code < 500
+    return isinstance(error, (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError, OSError))
+
+
+# One logged-in SMTP connection, reused for every batch it sends and reopened only after it breaks.
+class SMTPSender:
+    def __init__(self, user, password, host=SMTP_HOST, port=SMTP_PORT, timeout=SMTP_TIMEOUT):
+        self.user = user
+        self.password = password
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.conn = None
+
+    def __enter__(self):
+        return self
+
+    def connect(self):
+        if self.conn is None:
+            with dash_metrics.span('smtp_login'):
+                conn = smtplib.SMTP_SSL(self.host, self.port, timeout=self.timeout)
+                try:
+                    conn.login(self.user, self.password)
+                except BaseException:
+                    conn.close()
+                    raise
+            self.conn = conn
+        return self.conn
+
+    def reset(self):
+        conn, self.conn = self.conn, None
+        if conn is not None:
+            try:
+                conn.quit()
+            except (smtplib.SMTPException, OSError):
+                conn.close()
+
+    def send(self, sender, recipients, data):
+        refused = self.connect().sendmail(sender, recipients, data)
+        if refused:
+            print(f"Refused recipients: {', '.join(refused)}")
+        return refused
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.reset()
+        return False
+
+
+def send_batch(sender, from_addr, recipients, data, attempts=SEND_ATTEMPTS
+               , backoff_initial=BACKOFF_INITIAL, backoff_max=BACKOFF_MAX, backoff_factor=BACKOFF_FACTOR):
+    delay = backoff_initial
+    for attempt in range(1, attempts + 1):
+        try:
+            return sender.send(from_addr, recipients, data)
+        except Exception as e:
+            if not is_transient(e) or attempt == attempts:
+                raise
+            print(f"Send attempt {attempt} failed ({type(e).__name__}: {e}), retrying in {delay:.0f}s")
+            sender.reset()
+            time.sleep(delay)
+            delay = min(delay * backoff_factor, backoff_max)
+
+
+# Batches already accepted by the server, per delivery key, so a retried task only sends what is left.
+_delivered = {}
+_delivered_lock = threading.Lock()
+
+
+def delivered_batches(key):
+    with _delivered_lock:
+        return set(_delivered.get(key, ()))
+
+
+def mark_delivered(key, i):
+    with _delivered_lock:
+        _delivered.setdefault(key, set()).add(i)
+
+
+def forget_delivery(key):
+    with _delivered_lock:
+        _delivered.pop(key, None)
+
+
+# Sends the serialized message to every recipient in batches over up to `connections` reused logins.
+# Returns the refused addresses. Batches delivered under the same key by an earlier attempt are skipped.
+def deliver(data, recipients, user, password, key=None, batch_size=BATCH_SIZE, connections=CONNECTIONS, **retry):
+    recipient_batches = batches(recipients, batch_size)
+    pending = [i for i in range(len(recipient_batches)) if i not in delivered_batches(key)]
+    if len(pending) < len(recipient_batches):
+        print(f"Skipping {len(recipient_batches) - len(pending)} batches already delivered")
+
+    def worker(batch_ids):
+        refused = {}
+        with SMTPSender(user, password) as sender:
+            for i in batch_ids:
+                with dash_metrics.span(f'email_batch_{i}', rows=len(recipient_batches[i])):
+                    refused.update(send_batch(sender, user, recipient_batches[i], data, **retry))
+                mark_delivered(key, i)
+        return refused
+
+    n_workers = max(1, min(connections, len(pending)))
+    refused = {}
+    with ThreadPoolExecutor(max_workers=n_workers) as pool:
+        for result in pool.map(worker, [pending[w::n_workers] for w in range(n_workers)]):
+            refused.update(result)
+    forget_delivery(key)
+    return refused
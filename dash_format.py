@@ -0,0 +1,67 @@
+#%% Imports
+
+import numpy as np
+import pandas as pd
+
+
+MAX_DIGITS = 16
+POW10 = 10 ** np.arange(MAX_DIGITS, dtype='int64')
+
+
+#%% Currency
+
+# Builds '$1,234' / '$(1,234)' for a whole column at once: every digit, comma and bracket is
+# written into a fixed-width byte matrix with numpy, then each row is read back as one string.
+def _currency_strings(n, neg):
+    rows = np.arange(len(n))
+    length = 1 + (n[:, None] >= POW10[1:]).sum(axis=1)
+    digits = (n[:, None] // POW10) % 10
+
+    width = MAX_DIGITS + (MAX_DIGITS - 1) // 3 + 3
+    buf = np.full((len(n), width), ord(' '), dtype='uint8')
+    buf[:, -1] = np.where(neg, ord(')'), ord(' '))
+
+    col = width - 2
+    for j in range(MAX_DIGITS):
+        if j > 0 and j % 3 == 0:
+            buf[:, col] = np.where(length > j, ord(','), ord(' '))
+            col -= 1
+        buf[:, col] = np.where(length > j, digits[:, j] + ord('0'), ord(' '))
+        col -= 1
+
+    first = width - 1 - length - (length - 1) // 3
+    buf[rows, first - 1] = np.where(neg, ord('('), ord('$'))
+    buf[rows[neg], first[neg] - 2] = ord('$')
+
+    return np.strings.strip(buf.view(f'S{width}').ravel()).astype(str).astype(object)
+
+
+# Same output as '${:,.0f}' / '$({:,.0f})' with '-' for blanks (and zeros when zero_as_dash).
+def format_currency(values, zero_as_dash=True):
+    x = pd.Series(values, dtype='float64')
+    values = x.to_numpy()
+    dash = np.isnan(values)
+    if zero_as_dash:
+        dash = dash | (values == 0)
+
+    n = np.rint(np.abs(np.nan_to_num(values)))
+    big = n >= 10.0 ** MAX_DIGITS
+    neg = values < 0
+    out = _currency_strings(np.where(big, 0, n).astype('int64'), neg)
+
+    # str.format keeps the sign of negative zero
+    out[(values == 0) & np.signbit(values)] = '$-0'
+    for i in np.flatnonzero(big):
+        out[i] = '$({:,.0f})'.format(abs(values[i])) if neg[i] else '${:,.0f}'.format(values[i])
+    out[dash] = '-'
+    return pd.Series(out, index=x.index, dtype=object)
+
+
+def display_frame(df, clist, zero_as_dash=True):
+    display = pd.DataFrame(index=df.index)
+    for clmn in df.columns:
+        if clmn in clist:
+            display[clmn] = format_currency(df[clmn], zero_as_dash)
+        else:
+            display[clmn] = df[clmn].astype(str)
+    return display
@@ -0,0 +1,92 @@
+#%% Imports
+
+import io
+import os
+import json
+from PIL import Image
+from dash_config import EMAIL_BUDGET_KB
+
+
+# Width the email lays images out at. Charts are drawn at exactly this width, tables keep the resolution
+# they were rendered at (downscaling the small print blurs it without saving much) unless the budget needs it.
+IMAGE_WIDTH_PX = int(os.getenv('CASH_DASH_IMAGE_WIDTH', '800'))
+
+# Palette sizes tried in turn, then widths shrunk by WIDTH_STEP, until the message fits the budget.
+PALETTE_COLORS = [256, 128, 64]
+WIDTH_STEP = 0.8
+
+# Headers of each image's MIME part (type, disposition, Content-ID, encoding), rounded up.
+MIME_PART_BYTES = 512
+
+
+#%% Optimize
+
+# The charts and tables are flat colors on white, so transparency is flattened onto white before quantizing.
+def flatten(img):
+    if img.mode in ('RGBA', 'LA', 'P'):
+        img = img.convert('RGBA')
+        background = Image.new('RGB', img.size, 'white')
+        background.paste(img, mask=img.getchannel('A'))
+        return background
+    return img.convert('RGB')
+
+
+# Re-encodes a PNG as a palette image no wider than max_width, without text, dpi or colour profile chunks.
+def optimize_png(data, max_width=None, colors=256):
+    img = flatten(Image.open(io.BytesIO(data)))
+    resize = bool(max_width) and img.width > max_width
+    if resize:
+        img = img.resize((max_width, round(img.height * max_width / img.width)), Image.Resampling.LANCZOS)
+    img = img.quantize(colors=colors, method=Image.Quantize.MEDIANCUT, dither=Image.Dither.NONE)
+    img.info = {}
+    buf = io.BytesIO()
+    img.save(buf, format='png', optimize=True)
+    return buf.getvalue(), img.width
+
+
+# Bytes an image adds to the message: base64 (4 bytes per 3) in lines of 76 characters, plus its part headers.
+def encoded_size(data):
+    encoded = 4 * -(-len(data) // 3)
+    return encoded + 2 * -(-encoded // 76) + MIME_PART_BYTES
+
+
+def email_size(optimized):
+    return sum(encoded_size(png) for png, _ in optimized.values())
+
+
+def max_width(kind):
+    return IMAGE_WIDTH_PX if kind == 'chart' else None
+
+
+# Optimizes every artifact, then trades colors and then width on the largest images until they fit budget_kb
+# as encoded in the email. kinds maps each artifact name to 'chart' or 'table'.
+def optimize_artifacts(artifacts, kinds, budget_kb=EMAIL_BUDGET_KB, min_width=IMAGE_WIDTH_PX // 2):
+    budget = int(budget_kb * 1024)
+    settings = {name: {'width': max_width(kinds[name]), 'colors': PALETTE_COLORS[0]} for name in artifacts}
+    optimized = {name: optimize_png(png, settings[name]['width'], settings[name]['colors']) for name, png in artifacts.items()}
+
+    while email_size(optimized) > budget:
+        shrinkable = [name for name in optimized
+                      if settings[name]['colors'] > PALETTE_COLORS[-1] or optimized[name][1] * WIDTH_STEP >= min_width]
+        if not shrinkable:
+            total_kb = email_size(optimized) / 1024
+            raise ValueError(f'Dashboard images encode to {total_kb:,.0f} KB at the smallest settings, over the {budget_kb:,.0f} KB email budget')
+        name = max(shrinkable, key=lambda name: len(optimized[name][0]))
+        if settings[name]['colors'] > PALETTE_COLORS[-1]:
+            settings[name]['colors'] = PALETTE_COLORS[PALETTE_COLORS.index(settings[name]['colors']) + 1]
+        else:
+            settings[name]['width'] = int(optimized[name][1] * WIDTH_STEP)
+        optimized[name] = optimize_png(artifacts[name], settings[name]['width'], settings[name]['colors'])
+
+    report = []
+    for name, png in artifacts.items():
+        report.append({'artifact': name, 'before_bytes': len(png), 'after_bytes': len(optimized[name][0])
+                       , 'width': optimized[name][1], 'colors': settings[name]['colors']})
+    return {name: png for name, (png, _) in optimized.items()}, report
+
+
+def print_report(report):
+    for row in report:
+        print('dash_image ' + json.dumps(row))
+    before, after = sum(row['before_bytes'] for row in report), sum(row['after_bytes'] for row in report)
+    print(f"Images {before / 1024:,.0f} KB -> {after / 1024:,.0f} KB ({1 - after / max(before, 1):.0%} smaller)")
@@ -0,0 +1,94 @@
+#%% Imports
+
+import sys
+import json
+import time
+import threading
+import datetime as dt
+from contextlib import contextmanager
+from prefect.artifacts import create_table_artifact
+from prefect.runtime import flow_run
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+#%% Spans
+
+_spans = []
+_spans_lock = threading.Lock()
+
+
+# ru_maxrss is the process high-water mark, in KB on Linux and bytes on macOS.
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+class Span:
+    def __init__(self, name, rows=None):
+        self.name = name
+        self.rows = rows
+
+
+# Times one section of the dashboard. CPU time is per thread because the render tasks share the process.
+# Set span.rows inside the block when the row count is only known after the work is done.
+@contextmanager
+def span(name, rows=None):
+    s = Span(name, rows)
+    started_at = dt.datetime.now(dt.timezone.utc)
+    wall_start = time.perf_counter()
+    cpu_start = time.thread_time()
+    status = 'ok'
+    try:
+        yield s
+    except BaseException:
+        status = 'error'
+        raise
+    finally:
+        record = {
+            'stage': s.name,
+            'status': status,
+            'started_at': started_at.isoformat(timespec='milliseconds'),
+            'wall_s': round(time.perf_counter() - wall_start, 4),
+            'cpu_s': round(time.thread_time() - cpu_start, 4),
+            'peak_rss_mb': peak_rss_mb(),
+            'rows': s.rows,
+        }
+        with _spans_lock:
+            _spans.append(record)
+        print('dash_span ' + json.dumps(record))
+
+
+#%% Run
+
+def start_run():
+    with _spans_lock:
+        _spans.clear()
+
+
+def run_spans():
+    with _spans_lock:
+        return sorted(_spans, key=lambda record: record['started_at'])
+
+
+# Publishes the run's spans as a Prefect table artifact, so stage latencies can be trended across runs.
+def publish_run(key='cash-dash-stage-timings'):
+    records = run_spans()
+    if not records:
+        return None
+    print('dash_run ' + json.dumps({
+        'flow_run_id': str(flow_run.id) if flow_run.id else None,
+        'stages': len(records),
+        'failed': [record['stage'] for record in records if record['status'] != 'ok'],
+        'peak_rss_mb': max((record['peak_rss_mb'] or 0) for record in records),
+    }))
+    try:
+        return create_table_artifact(key=key, table=records, description='Cash dash stage timings')
+    except Exception as e:
+        print(f"Unable to publish stage timings artifact: {e}")
+        return None
@@ -0,0 +1,103 @@
+#%% Imports
+
+import os
+import sys
+import dash_charts
+import dash_tables
+import dash_format
+import dash_images
+import render_cache
+
+
+# Every image in the cash dash, in the order they appear in the email. {comparison} in a caption names what the
+# views compare against.
+DASH_ARTIFACTS = {
+    'day_chart': {'kind': 'chart', 'file': 'day_chart.png'},
+    'mtd_budget_table': {'kind': 'table', 'file': 'mtd_budget_table.png', 'view': 'mtd_budget_table'
+                         , 'caption': "Current Month Cash by Product vs {comparison}", 'zero_as_dash': True},
+    'day_table': {'kind': 'table', 'file': 'day_table.png', 'view': 'day_table'
+                  , 'caption': "Current Month Cash by Product by Day", 'zero_as_dash': True},
+    'month_chart': {'kind': 'chart', 'file': 'month_chart.png'},
+    'ytd_budget': {'kind': 'table', 'file': 'ytd_budget.png', 'view': 'ytd_budget_table'
+                   , 'caption': "YTD Cash by Product vs {comparison}", 'zero_as_dash': False},
+    'month_table': {'kind': 'table', 'file': 'month_table.png', 'view': 'month_table'
+                    , 'caption': "Cash by Product by Month", 'zero_as_dash': False},
+}
+
+
+#%% Functions
+
+# The drawing code itself is part of every cache key.
+def render_fingerprint():
+    global _render_fingerprint
+    if _render_fingerprint is None:
+        _render_fingerprint = render_cache.source_fingerprint([dash_charts, dash_tables, dash_format, sys.modules[__name__]])
+    return _render_fingerprint
+
+
+_render_fingerprint = None
+
+
+def caption(name, views):
+    return DASH_ARTIFACTS[name]['caption'].format(comparison=views['comparison_label'])
+
+
+# Key from the exact inputs of one image: the aggregate it draws plus its caption, format and renderer settings.
+def artifact_key(name, views, cat_list, renderer):
+    spec = DASH_ARTIFACTS[name]
+    if name == 'day_chart':
+        inputs = [views['day_total'], views['day_budget'], views['comparison_label'], dash_images.IMAGE_WIDTH_PX]
+    elif name == 'month_chart':
+        inputs = [views['month_total'], views['month_budget'], views['comparison_label'], dash_images.IMAGE_WIDTH_PX]
+    else:
+        inputs = [views[spec['view']], cat_list, renderer]
+    return render_cache.render_key(render_fingerprint(), name, sorted(spec.items()), *inputs)
+
+
+# Returns the image as PNG bytes. With spill_dir set (debugging) the PNG, and the HTML behind an
+# html-rendered table, are also written there.
+def render_artifact(name, views, cat_list, renderer=dash_tables.DEFAULT_TABLE_RENDERER, browser=None, cache=None, spill_dir=None):
+    spec = DASH_ARTIFACTS[name]
+    if cache is not None:
+        key = artifact_key(name, views, cat_list, renderer)
+        png = cache.render(key, spec['file'], lambda: render_artifact(name, views, cat_list, renderer, browser))
+    elif name == 'day_chart':
+        png = dash_charts.day_chart(views['day_total'], views['day_budget'], dash_images.IMAGE_WIDTH_PX, views['comparison_label'])
+    elif name == 'month_chart':
+        png = dash_charts.month_chart(views['month_total'], views['month_budget'], dash_images.IMAGE_WIDTH_PX, views['comparison_label'])
+    else:
+        display = dash_format.display_frame(views[spec['view']], cat_list + ['Total'], spec['zero_as_dash'])
+        png = dash_tables.render_table(display, caption(name, views), renderer=renderer, browser=browser, name=name)
+
+    if spill_dir is not None:
+        write_artifacts({name: png}, spill_dir)
+        if spec['kind'] == 'table' and renderer == 'html':
+            display = dash_format.display_frame(views[spec['view']], cat_list + ['Total'], spec['zero_as_dash'])
+            with open(os.path.join(spill_dir, os.path.splitext(spec['file'])[0] + '.html'), 'w') as f:
+                f.write(dash_tables.table_html(display, caption(name, views)))
+    return png
+
+
+def write_artifacts(artifacts, output_dir):
+    os.makedirs(output_dir, exist_ok=True)
+    filepaths = {}
+    for name, png in artifacts.items():
+        filepaths[name] = os.path.join(output_dir, DASH_ARTIFACTS[name]['file'])
+        with open(filepaths[name], 'wb') as f:
+            f.write(png)
+    return filepaths
+
+
+# Palette-quantized, metadata-free copies sized for the email, plus before/after bytes per image.
+def optimize_dashboard(artifacts, budget_kb=dash_images.EMAIL_BUDGET_KB):
+    kinds = {name: DASH_ARTIFACTS[name]['kind'] for name in artifacts}
+    return dash_images.optimize_artifacts(artifacts, kinds, budget_kb)
+
+
+def render_dashboard(views, cat_list, table_renderers=None, browser=None):
+    table_renderers = table_renderers or {}
+    artifacts = {}
+    for name in DASH_ARTIFACTS:
+        renderer = table_renderers.get(name, dash_tables.DEFAULT_TABLE_RENDERER)
+        artifacts[name] = render_artifact(name, views, cat_list, renderer, browser)
+    return artifacts
@@ -0,0 +1,142 @@
+#%% Imports
+
+import datetime as dt
+from dataclasses import dataclass, field, fields, replace
+import dash_config
+
+
+# Every image of the cash dash, in email order.
+CASH_DASH_ARTIFACTS = ('day_chart', 'mtd_budget_table', 'day_table', 'month_chart', 'ytd_budget', 'month_table')
+
+# Prefect Variable holding extra report specs as a list of ReportSpec fields, e.g.
+# [{"name": "digital", "subject": "Digital Daily Dash", "groups": {"Digital": ["Software", "Coaching"]}, "recipients_variable": "email_digital_dash"}]
+REPORTS_VARIABLE = 'cash_dash_reports'
+
+# Prefect Variable mapping each recipient group's Variable to the categories it owns, e.g.
+# {"email_cash_dash_coaching": ["Coaching"], "email_cash_dash_live": ["Events", "Merch"]}
+SEGMENTS_VARIABLE = 'cash_dash_segments'
+
+
+#%% Specs
+
+# One emailed dashboard. Categories default to the cash_dash_categories Variable; groups merges categories
+# into named columns before the views are built; filter_categories drops every other category from the totals
+# as well. lag_days reports as of that many days before the run's date. comparison is one of dash_config.COMPARISONS.
+@dataclass(frozen=True)
+class ReportSpec:
+    name: str
+    subject: str = 'MM Daily Dash'
+    categories: tuple | None = None
+    groups: dict = field(default_factory=dict)
+    artifacts: tuple = CASH_DASH_ARTIFACTS
+    recipients_variable: str = 'email_cash_dash'
+    lag_days: int = 0
+    table_renderers: dict = field(default_factory=dict)
+    filter_categories: bool = False
+    comparison: str = dash_config.DEFAULT_COMPARISON
+
+    def report_date(self, base_date):
+        return base_date - dt.timedelta(days=self.lag_days)
+
+    # Grouped reports show the group names, in the order given.
+    def cat_list(self, default_categories):
+        if self.groups:
+            return list(self.groups)
+        return list(self.categories or default_categories)
+
+    def group_map(self):
+        return {category: group for group, categories in self.groups.items() for category in categories}
+
+    def renderer(self, name, overrides, default):
+        return overrides.get(name, self.table_renderers.get(name, default))
+
+
+CASH_DASH = ReportSpec(name='cash_dash')
+
+
+# Lists in the Variables may be written as a JSON list or as one comma-separated string.
+def as_tuple(value):
+    return tuple(value.split(',') if isinstance(value, str) else value)
+
+
+def report_from_dict(values):
+    known = {f.name for f in fields(ReportSpec)}
+    unknown = sorted(set(values) - known)
+    if unknown:
+        raise ValueError(f'report field {", ".join(unknown)} is invalid, please choose between ({", ".join(sorted(known))})')
+    values = dict(values)
+    for key in ['categories', 'artifacts']:
+        if values.get(key) is not None:
+            values[key] = as_tuple(values[key])
+    if values.get('groups'):
+        values['groups'] = {group: as_tuple(categories) for group, categories in values['groups'].items()}
+    return ReportSpec(**values)
+
+
+def validate_reports(reports, artifact_names):
+    names = [report.name for report in reports]
+    if len(set(names)) < len(names):
+        raise ValueError(f'report names must be unique, got ({", ".join(names)})')
+    for report in reports:
+        unknown = [name for name in report.artifacts if name not in artifact_names]
+        if unknown:
+            raise ValueError(f'artifact {", ".join(unknown)} in report {report.name} is invalid, please choose between ({", ".join(artifact_names)})')
+        if report.comparison not in dash_config.COMPARISONS:
+            raise ValueError(f'comparison {report.comparison} in report {report.name} is invalid, please choose between ({", ".join(dash_config.COMPARISONS)})')
+    return reports
+
+
+# The cash dash plus any reports in the Variable (an entry named cash_dash replaces it); names picks a subset to run.
+def select_reports(configured, names=None):
+    reports = [CASH_DASH] + [report_from_dict(values) for values in configured or []]
+    reports = list({report.name: report for report in reports}.values())
+    if names is None:
+        return reports
+    by_name = {report.name: report for report in reports}
+    unknown = [name for name in names if name not in by_name]
+    if unknown:
+        raise ValueError(f'report {", ".join(unknown)} is invalid, please choose between ({", ".join(by_name)})')
+    return [by_name[name] for name in names]
+
+
+# Fan-out: one copy of base per recipient group, showing only that group's categories.
+def segment_reports(segments, base=CASH_DASH):
+    reports = []
+    for recipients_variable, categories in (segments or {}).items():
+        categories = as_tuple(categories)
+        reports.append(replace(base
+                               , name='segment_' + recipients_variable
+                               , subject=f"{base.subject} ({', '.join(categories)})"
+                               , categories=categories
+                               , groups={}
+                               , recipients_variable=recipients_variable
+                               , filter_categories=True))
+    return reports
+
+
+#%% Plan
+
+# Keys that let reports share work: one fetch per period, one cube per period and category grouping, one
+# view build per cube, category layout and comparison, one render per view build, image and renderer.
+def fetch_key(eom, budget_year, end):
+    return (eom, budget_year, end)
+
+
+def cube_key(period, groups):
+    return (period, tuple(sorted((k, tuple(v)) for k, v in groups.items())))
+
+
+def views_key(cube, cat_list, filter_categories, comparison):
+    return (cube, tuple(cat_list), filter_categories, comparison)
+
+
+def render_key(views, name, renderer):
+    return (views, name, renderer)
+
+
+# Greeting, the images with a blank line between them, sign-off.
+def email_body(artifact_names):
+    body = ["Good morning!  Here is today's update:", "", ""]
+    for i, name in enumerate(artifact_names):
+        body += [name] if i == len(artifact_names) - 1 else [name, ""]
+    return body + ["Have a great day!"]
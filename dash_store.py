@@ -0,0 +1,129 @@
+#%% Imports
+
+import os
+import sqlite3
+from contextlib import closing
+import pandas as pd
+import revenue_data
+import dash_aggregates
+from dash_config import RESTATEMENT_DAYS
+
+
+# Daily totals per category, one row per day and category.
+STORE_PATH = os.getenv('CASH_DASH_STORE_PATH', os.path.join(revenue_data.CACHE_DIR, 'daily_revenue.sqlite'))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS daily_revenue (
+    effective_date TEXT NOT NULL
+    , new_category TEXT NOT NULL
+    , amount_cents INTEGER NOT NULL
+    , PRIMARY KEY (effective_date, new_category)
+) WITHOUT ROWID;
+"""
+
+
+#%% Functions
+
+# Summed in BigQuery so only one row per day and category comes back, in integer cents like the compact layout.
+def daily_sql(where=''):
+    return f"""
+    SELECT effective_date
+        , new_category
+        , SUM(CAST(ROUND(amount * 100) AS INT64)) AS amount_cents
+    FROM `{revenue_data.REVENUE_TABLE}`
+    {where}
+    GROUP BY effective_date, new_category;
+    """
+
+
+# Same daily totals from raw effective_date / new_category / amount rows.
+def daily_totals(df):
+    cents = (df['amount'] * 100).round().astype('int64')
+    df_daily = cents.groupby([df['effective_date'], df['new_category'].astype(str)]).sum()
+    return df_daily.rename('amount_cents').reset_index()
+
+
+#%% Store
+
+# Every dashboard view is a range query on the (effective_date, new_category) primary key, so reading a
+# period costs the same however many years of history the file holds.
+class DailyStore:
+    def __init__(self, path=STORE_PATH):
+        self.path = path
+
+    def connect(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=60)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute(SCHEMA)
+        return conn
+
+    def watermark(self):
+        with closing(self.connect()) as conn:
+            value = conn.execute('SELECT MAX(effective_date) FROM daily_revenue').fetchone()[0]
+        return None if value is None else pd.Timestamp(value)
+
+    # Replaces every day from start on (all of them without a start) in one transaction, so a reader sees
+    # either the old or the new totals and days that disappeared upstream are dropped too.
+    def upsert_days(self, df_daily, start=None):
+        df_daily = df_daily.dropna(subset=['new_category'])
+        rows = zip(pd.to_datetime(df_daily['effective_date']).dt.strftime('%Y-%m-%d')
+                   , df_daily['new_category'].astype(str)
+                   , df_daily['amount_cents'].astype('int64').tolist())
+        with closing(self.connect()) as conn, conn:
+            if start is None:
+                conn.execute('DELETE FROM daily_revenue')
+            else:
+                conn.execute('DELETE FROM daily_revenue WHERE effective_date >= ?', (f'{start:%Y-%m-%d}',))
+            conn.executemany("""
+                INSERT INTO daily_revenue (effective_date, new_category, amount_cents) VALUES (?, ?, ?)
+                ON CONFLICT (effective_date, new_category) DO UPDATE SET amount_cents = excluded.amount_cents
+                """, rows)
+
+    # Re-reads only the restatement window before the watermark, or everything when the store is empty.
+    def refresh(self, con, restatement_days=RESTATEMENT_DAYS, full_refresh=False):
+        watermark = None if full_refresh else self.watermark()
+        if watermark is None:
+            df_daily = con.read(daily_sql())
+            self.upsert_days(df_daily)
+            print(f"Store full refresh: {len(df_daily):,} daily rows")
+            return
+        cutoff = watermark - pd.Timedelta(days=restatement_days)
+        df_daily = con.read(daily_sql(f"WHERE effective_date >= '{cutoff:%Y-%m-%d}'"))
+        self.upsert_days(df_daily, cutoff)
+        print(f"Store refresh from {cutoff:%Y-%m-%d}: {len(df_daily):,} daily rows")
+
+    def query(self, sql, params):
+        with closing(self.connect()) as conn:
+            return pd.read_sql_query(sql, conn, params=params)
+
+    # The same df_day / df_month frames dash_aggregates builds from raw rows.
+    def aggregates(self, eom, budget_year, end=None, current_only=False):
+        p = dash_aggregates.dash_periods(eom, budget_year, end, current_only)
+        end = '9999-12-31' if p['end'] is None else f"{p['end']:%Y-%m-%d}"
+
+        days = 'effective_date >= :recent_date'
+        if p['prior_start'] is not None:
+            days += ' OR effective_date BETWEEN :prior_start AND :prior_end'
+        df_day = self.query(f"""
+            SELECT effective_date, new_category, amount_cents
+            FROM daily_revenue
+            WHERE ({days}) AND effective_date < :end
+            ORDER BY effective_date, new_category
+            """, {'recent_date': f"{p['recent_date']:%Y-%m-%d}", 'end': end
+                  , 'prior_start': p['prior_start'] and f"{p['prior_start']:%Y-%m-%d}"
+                  , 'prior_end': p['prior_end'] and f"{p['prior_end']:%Y-%m-%d}"})
+
+        df_month = self.query("""
+            SELECT SUBSTR(effective_date, 1, 7) AS yrmnth, new_category, SUM(amount_cents) AS amount_cents
+            FROM daily_revenue
+            WHERE effective_date >= :start AND effective_date < :stop AND effective_date < :end
+            GROUP BY yrmnth, new_category
+            ORDER BY yrmnth, new_category
+            """, {'start': f"{min(p['years'])}-01-01", 'stop': f"{max(p['years']) + 1}-01-01", 'end': end})
+
+        df_day['effective_date'] = pd.to_datetime(df_day['effective_date'])
+        df_month['yrmnth'] = pd.PeriodIndex(df_month['yrmnth'], freq='M')
+        for df_agg in [df_day, df_month]:
+            df_agg['amount'] = df_agg.pop('amount_cents') / 100
+        return df_day, df_month
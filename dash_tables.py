@@ -0,0 +1,177 @@
+#%% Imports
+
+import io
+from PIL import Image, ImageDraw, ImageFont
+from matplotlib import font_manager
+from dash_config import TABLE_RENDERERS, DEFAULT_TABLE_RENDERER
+
+
+BORDER_COLOR = '#305496'
+BAND_COLOR = '#D9E1F2'
+
+
+#%% Styler
+
+TABLE_STYLES = [
+    # Caption
+    {
+        'selector': 'caption',
+        'props': 'font-weight: bold;\
+            font-size: 18px;\
+            font-family: Century Gothic, sans-serif;\
+            padding: 0px 0px 5px 0px;'
+    },
+    # Column Headers
+    {
+        'selector': 'thead th',
+        'props': 'background-color: #FFFFFF;\
+            color: #305496;\
+            border-bottom: 2px solid #305496;\
+            text-align: left;\
+            font-size: 14px;\
+            font-family: Century Gothic, sans-serif;\
+            padding: 0px 20px 0px 5px;'
+    },
+    # Last Column Header
+    {
+        'selector': 'thead th:last-child',
+        'props': 'color: black;'
+    },
+    # Even Rows
+    {
+        'selector': 'tbody tr:nth-child(even)',
+        'props': 'background-color: white;\
+            color: black;'
+    },
+    # Odd Rows
+    {
+        'selector': 'tbody tr:nth-child(odd)',
+        'props': 'background-color: #D9E1F2;'
+    },
+    # Last Row
+    {
+        'selector': 'tbody tr:last-child td',
+        'props': 'font-weight: bold;\
+            border-top: 2px solid #305496;'
+    },
+    # First Column
+    {
+        'selector': 'tbody td:first-child',
+        'props': 'border-right: 2px solid #305496;'
+    },
+    # Last Column
+    {
+        'selector': 'tbody td:last-child',
+        'props': 'font-weight: bold;\
+            border-left: 2px solid #305496;'
+    },
+    ]
+
+
+# Tables arrive already formatted by dash_format.display_frame, so the Styler only adds layout.
+def style_table(df, caption):
+    return df.style\
+        .set_caption(caption)\
+        .hide(axis="index")\
+        .set_properties(**{'text-align': 'left'})\
+        .set_properties(**{'font-size': '14px;'})\
+        .set_properties(**{'font-family': 'Century Gothic, sans-serif;'})\
+        .set_properties(**{'padding': '3px 20px 3px 5px;'})\
+        .set_table_styles(TABLE_STYLES)
+
+
+def table_html(df, caption):
+    html = style_table(df, caption).to_html()
+    html = html.replace('<style type="text/css">', '<style type="text/css">\ntable {\n\tborder-spacing: 0;\n}')
+    return html
+
+
+#%% HTML Renderer
+
+def render_table_html(df, caption, browser, name='table'):
+    return browser.screenshot(table_html(df, caption), name)
+
+
+#%% Raster Renderer
+
+def _font(size, bold=False):
+    prop = font_manager.FontProperties(family=['Century Gothic', 'sans-serif'], weight='bold' if bold else 'normal')
+    return ImageFont.truetype(font_manager.findfont(prop), size)
+
+
+# Draws the same layout as TABLE_STYLES straight to PNG, so no browser is needed. At scale 1 it is the size of
+# the HTML screenshot; the email shows images at their pixel size, so larger scales show up larger.
+def render_table_raster(df, caption, scale=1):
+    s = lambda x: int(round(x * scale))
+    font = _font(s(14))
+    font_bold = _font(s(14), bold=True)
+    font_caption = _font(s(18), bold=True)
+
+    header = [str(x) for x in df.columns]
+    rows = df.astype(str).values.tolist()
+    n_rows, n_clmns = len(rows), len(header)
+    last_row, last_clmn = n_rows - 1, n_clmns - 1
+
+    def cell_font(i, j):
+        return font_bold if i == last_row or j == last_clmn else font
+
+    line_height = s(14 * 1.25)
+    pad_left, pad_right, pad_y, border = s(5), s(20), s(3), s(2)
+
+    widths = []
+    for j in range(n_clmns):
+        width = font_bold.getlength(header[j])
+        for i in range(n_rows):
+            width = max(width, cell_font(i, j).getlength(rows[i][j]))
+        widths.append(int(width) + pad_left + pad_right)
+    x_starts = [sum(widths[:j]) for j in range(n_clmns)]
+
+    caption_height = s(18 * 1.25) + s(5)
+    header_height = line_height + border
+    row_height = line_height + 2 * pad_y
+    width = sum(widths)
+    height = caption_height + header_height + n_rows * row_height + border
+
+    img = Image.new('RGB', (width, height), 'white')
+    draw = ImageDraw.Draw(img)
+
+    draw.text((width / 2, 0), caption, font=font_caption, fill='black', anchor='ma')
+
+    y = caption_height
+    for j in range(n_clmns):
+        color = 'black' if j == last_clmn else BORDER_COLOR
+        draw.text((x_starts[j] + pad_left, y), header[j], font=font_bold, fill=color)
+    y += line_height
+    draw.rectangle([0, y, width - 1, y + border - 1], fill=BORDER_COLOR)
+    y += border
+
+    for i in range(n_rows):
+        if i == last_row:
+            draw.rectangle([0, y, width - 1, y + border - 1], fill=BORDER_COLOR)
+            y += border
+        if i % 2 == 0:
+            draw.rectangle([0, y, width - 1, y + row_height - 1], fill=BAND_COLOR)
+        for j in range(n_clmns):
+            draw.text((x_starts[j] + pad_left, y + pad_y), rows[i][j], font=cell_font(i, j), fill='black')
+        y += row_height
+
+    body_top = caption_height + header_height
+    if n_clmns > 1:
+        for x in [x_starts[1], x_starts[last_clmn]]:
+            draw.rectangle([x - border // 2, body_top, x - border // 2 + border - 1, height - 1], fill=BORDER_COLOR)
+
+    buf = io.BytesIO()
+    img.save(buf, format='png')
+    return buf.getvalue()
+
+
+#%% Render
+
+# Returns the table as PNG bytes.
+def render_table(df, caption, renderer=DEFAULT_TABLE_RENDERER, browser=None, name='table'):
+    if renderer == 'html':
+        return render_table_html(df, caption, browser, name)
+    elif renderer == 'raster':
+        return render_table_raster(df, caption)
+    else:
+        raise ValueError(f'table renderer is invalid, please choose between ({", ".join(TABLE_RENDERERS)})')
@@ -0,0 +1,160 @@
+#%% Imports
+
+import pandas as pd
+import numpy as np
+import datetime as dt
+import dash_compare
+
+
+#%% Functions
+
+def dash_dates(today):
+    eom = today + dt.timedelta(days=-1) + pd.offsets.MonthEnd(0)
+    recent_date = eom + pd.offsets.MonthBegin(-1)
+    recent_date = dt.datetime(recent_date.year, recent_date.month, recent_date.day)
+    peom = eom + pd.offsets.MonthEnd(-12)
+    return eom, recent_date, peom
+
+
+def total_table(sub, label, cat_list, total_clmns):
+    values = sub[total_clmns].to_numpy(dtype=float)
+    values = np.vstack([values, np.nansum(values, axis=0)])
+    table = pd.DataFrame(values, columns=total_clmns)
+    table.insert(0, label, list(sub.index) + ['Total'])
+    table['Total'] = np.nansum(values, axis=1)
+    return table[[label] + cat_list + ['Total']]
+
+
+def compare_table(current, prior, cat_list, label='Prior Year'):
+    clmns = current.index.union(prior.index, sort=False)
+    current = current.reindex(clmns, fill_value=0).to_numpy(dtype=float)
+    prior = prior.reindex(clmns, fill_value=0).to_numpy(dtype=float)
+    values = np.vstack([current, prior, current - prior])
+    table = pd.DataFrame(values, columns=clmns)
+    table['Total'] = values.sum(axis=1)
+    table = table.reindex(columns=cat_list + ['Total'], fill_value=0)
+    table.insert(0, 'Type', ['Current Year', label, 'Variance'])
+    return table
+
+
+#%% Groups
+
+# Sums the aggregate rows of every category in a group under the group's name, other categories pass through.
+def group_categories(df, group_map, index):
+    if not group_map:
+        return df
+    category = df['new_category'].astype(str)
+    df = df.assign(new_category=category.map(group_map).fillna(category))
+    return df.groupby([index, 'new_category'], as_index=False, sort=False)['amount'].sum()
+
+
+#%% Cube
+
+# Period x category grid of amounts, columns ordered cat_list first then any other categories in the data.
+# Cells with no rows stay NaN so the tables can tell "no sales" apart from a zero total.
+def cube_pivot(df, index, cat_list):
+    cube = df.pivot(index=index, columns='new_category', values='amount')
+    extras = sorted(c for c in cube.columns if c not in cat_list)
+    cube = cube.reindex(columns=cat_list + extras, fill_value=0)
+    cube.columns.name = None
+    return cube
+
+
+def cube_slice(cube, mask):
+    sub = cube[mask]
+    absent = sub.columns[sub.isna().all().to_numpy()]
+    if len(sub) > 0 and len(absent) > 0:
+        sub = sub.copy()
+        sub[absent] = 0
+    return sub
+
+
+# df_budget, when given, is the budget table by month and category, pivoted alongside the actuals.
+class DashCube:
+    def __init__(self, df_day, df_month, cat_list, df_budget=None):
+        self.cat_list = cat_list
+        self.daily = cube_pivot(df_day, 'effective_date', cat_list)
+        self.monthly = cube_pivot(df_month, 'yrmnth', cat_list)
+        self.budget = None if df_budget is None else cube_pivot(df_budget, 'yrmnth', cat_list)
+
+    # The same cube narrowed to some categories: a column slice of the shared pivots, nothing is re-aggregated.
+    def select(self, categories):
+        sub = object.__new__(DashCube)
+        sub.cat_list = list(categories)
+        sub.daily = self.daily.reindex(columns=sub.cat_list, fill_value=0)
+        sub.monthly = self.monthly.reindex(columns=sub.cat_list, fill_value=0)
+        sub.budget = None if self.budget is None else self.budget.reindex(columns=sub.cat_list, fill_value=0)
+        return sub
+
+    def current_days(self, recent_date):
+        days = cube_slice(self.daily, self.daily.index >= recent_date)
+        days.index = days.index.date
+        return days
+
+    def current_months(self, year):
+        return cube_slice(self.monthly, self.monthly.index.year == year)
+
+    def month_days(self, month_end):
+        mask = (self.daily.index > month_end + pd.offsets.MonthEnd(-1)) & (self.daily.index <= month_end)
+        return cube_slice(self.daily, mask)
+
+    def months(self, budget):
+        if budget and self.budget is None:
+            raise ValueError('budget comparison needs the budget table, none was read for this cube')
+        return self.budget if budget else self.monthly
+
+    def months_through(self, year, month_end, budget=False):
+        months = self.months(budget)
+        mask = (months.index.year == year) & (months.index.to_timestamp(how='end').normalize() <= month_end)
+        return cube_slice(months, mask)
+
+    def month_of(self, year, month_end, budget=False):
+        months = self.months(budget)
+        mask = (months.index.year == year) & (months.index.to_timestamp(how='end').normalize() == month_end)
+        return cube_slice(months, mask)
+
+
+#%% Views
+
+def build_views(df_day, df_month, eom, recent_date, peom, budget_year, cat_list, comparison='prior_month', df_budget=None):
+    cube = DashCube(df_day, df_month, cat_list, df_budget)
+    return cube_views(cube, eom, recent_date, peom, budget_year, cat_list, comparison)
+
+
+# Views for several category layouts, {key: (cat_list, filter_categories, comparison)}, from one cube. Filtered
+# layouts leave every other category out of the totals too. Pivoting happens once however many layouts there are.
+def layout_views(df_day, df_month, eom, recent_date, peom, budget_year, layouts, df_budget=None):
+    cat_lists = [cat_list for cat_list, _, _ in layouts.values()]
+    union = list(dict.fromkeys(c for cat_list in cat_lists for c in cat_list))
+    cube = DashCube(df_day, df_month, union, df_budget)
+    views = {}
+    for key, (cat_list, filter_categories, comparison) in layouts.items():
+        views[key] = cube_views(cube.select(cat_list) if filter_categories else cube, eom, recent_date, peom, budget_year, list(cat_list), comparison)
+    return views
+
+
+def cube_views(cube, eom, recent_date, peom, budget_year, cat_list, comparison='prior_month'):
+    all_clmns = list(cube.daily.columns)
+    label = dash_compare.COMPARISON_LABELS[comparison]
+
+    # Daily totals cover every category in the data, monthly totals only the cat_list categories.
+    days = cube.current_days(recent_date)
+    day_totals = days.sum(axis=0)
+
+    months = cube.current_months(eom.year)[cat_list]
+    month_totals = months.sum(axis=0)
+
+    through = days.index.max() if len(days) > 0 else recent_date - dt.timedelta(days=1)
+    base_month, base_months = dash_compare.comparison(cube, comparison, eom, peom, budget_year, through)
+
+    return {
+        'day_total': days.sum(axis=1),
+        'day_budget': base_month.sum(),
+        'day_table': total_table(days, 'Date', cat_list, all_clmns),
+        'mtd_budget_table': compare_table(day_totals, base_month, cat_list, label),
+        'month_total': months.sum(axis=1),
+        'month_budget': base_months.sum(axis=1).cumsum(),
+        'month_table': total_table(months, 'Date', cat_list, cat_list),
+        'ytd_budget_table': compare_table(month_totals, base_months.sum(axis=0), cat_list, label),
+        'comparison_label': label,
+    }
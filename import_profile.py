@@ -0,0 +1,77 @@
+#%% Imports
+
+import os
+import sys
+import json
+import argparse
+import subprocess
+import datetime as dt
+
+
+RESULTS_FILE = 'import_profile.jsonl'
+
+# What each invocation path has to import: the readiness check runs first, the render path only once data is ready.
+PROFILES = {
+    'readiness': 'import prefect_run',
+    'render': 'import prefect_run, dash_aggregates, dash_store, dash_compare, dash_views, dash_render, browser_session, render_cache, dash_email',
+}
+
+# Packages the readiness path should not load.
+HEAVY = ['pandas', 'numpy', 'pyarrow', 'matplotlib', 'PIL', 'google.cloud.bigquery', 'selenium', 'dbharbor', 'dwebdriver']
+
+
+#%% Profile
+
+# Parses `python -X importtime` stderr into (package, self_us, cumulative_us, depth) rows.
+def parse_importtime(stderr):
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip(' ')) - 1) // 2
+        rows.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return rows
+
+
+def profile_imports(statement, cwd=None):
+    cwd = cwd or os.path.dirname(os.path.abspath(__file__))
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', statement], cwd=cwd, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"import profile failed for {statement!r}:\n{result.stderr[-2000:]}")
+    return parse_importtime(result.stderr)
+
+
+# Best of repeat runs, with the slowest direct imports so a new heavy import on the startup path stands out.
+def import_report(name, statement, repeat=3, top=15):
+    runs = [profile_imports(statement) for _ in range(repeat)]
+    best = min(runs, key=lambda rows: sum(row[2] for row in rows if row[3] == 0))
+    top_level = [row for row in best if row[3] == 0]
+    direct = sorted((row for row in best if row[3] <= 1), key=lambda row: -row[2])
+    names = {row[0] for row in best}
+    return {
+        'timestamp': dt.datetime.now().isoformat(timespec='seconds'),
+        'profile': name,
+        'statement': statement,
+        'python': sys.version.split()[0],
+        'total_ms': round(sum(row[2] for row in top_level) / 1000, 1),
+        'modules': len(best),
+        'heavy_loaded': [package for package in HEAVY if package in names],
+        'top_ms': {row[0]: round(row[2] / 1000, 1) for row in direct[:top]},
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Import-time profile of the cash dash startup paths.')
+    parser.add_argument('--profiles', nargs='+', choices=list(PROFILES), default=list(PROFILES))
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', default=RESULTS_FILE)
+    args = parser.parse_args()
+
+    for name in args.profiles:
+        report = import_report(name, PROFILES[name], args.repeat)
+        with open(args.output, 'a') as f:
+            f.write(json.dumps(report) + '\n')
+        print(f"{name}: {report['total_ms']:,.0f}ms, {report['modules']} modules, heavy: {', '.join(report['heavy_loaded']) or 'none'}")
+        for module, ms in report['top_ms'].items():
+            print(f"    {module:<40} {ms:>8,.1f}ms")
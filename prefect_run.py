@@ -1,636 +1,303 @@
 #%% Imports
 
 from prefect import flow, task
-from prefect.variables import Variable
-from prefect.blocks.system import Secret
-from dbharbor.bigquery import SQL
-import pandas as pd
-import matplotlib.pyplot as plt
+from prefect.tasks import task_input_hash
+from prefect.task_runners import ThreadPoolTaskRunner
 import datetime as dt
-from demail.gmail import SendEmail
 import os
-from matplotlib.dates import date2num
-from dwebdriver import ChromeDriver
-import json
 import asyncio
 import check_good_data
+import dash_config
+import dash_metrics
+import resources
+from prefect.runtime import flow_run
 
+# pandas, pyarrow, matplotlib, the google clients and dwebdriver are imported inside the
+# tasks that use them, so a run that stops at the readiness check only pays for prefect.
 
-@task(log_prints=True)
-def run_email_cash_dash_task():
-    var1 = Variable.get('cash_dash_categories')
-    cat_list = var1['CAT_LIST'].split(',')
 
-    email_block = Secret.load("email-gmail")
-    email_value = email_block.get()
-    EMAIL_UID = email_value.get("EMAIL_UID")
-    EMAIL_PWD = email_value.get("EMAIL_PWD")
+#%% Functions
 
-    var1 = Variable.get('email_fail_notifications')
-    EMAIL_FAIL = var1['EMAIL_FAIL']
+# Shared by the tasks of one flow run, built from the secret in memory rather than a credentials file.
+def get_bigquery_con():
+    return resources.bigquery_con()
 
-    var1 = Variable.get('email_cash_dash')
-    EMAIL_SEND = var1['EMAIL_SEND']
 
-    bigquery_block = Secret.load("bbg-bigquery-sa")
-    bigquery_value = bigquery_block.get()
-    with open('bigquery-bbg-platform.json', 'w') as f:
-        json.dump(bigquery_value, f)
-    BIGQUERY_CRED = 'bigquery-bbg-platform.json'
-    con = SQL(BIGQUERY_CRED)
+# Upstream signals the email waits for, e.g. {"DEPLOYMENTS": "dbt-analytics-master", "TABLES": "project.dataset.table#partition"}
+def freshness_signals():
+    var1 = resources.variable('cash_dash_freshness', default={})
+    deployments = [d for d in var1.get('DEPLOYMENTS', ','.join(check_good_data.DBT_DEPLOYMENTS)).split(',') if d]
+    tables = [t for t in var1.get('TABLES', '').split(',') if t]
+    bq_client = get_bigquery_con().client if tables else None
+    return deployments, tables, bq_client
 
-    fmt = lambda x: '-' if pd.isna(x) or x == 0 else '${:,.0f}'.format(x) if x >= 0 else '$({:,.0f})'.format(abs(x))
 
+# Artifacts stay in memory as PNG bytes; set CASH_DASH_DEBUG_DIR (or debug_dir) to also write them to disk.
+DEBUG_DIR = os.getenv('CASH_DASH_DEBUG_DIR')
 
-    #%% Functions
 
-    def df_add_missing_clmns(df, clist = cat_list):
-        for x in clist:
-            if x not in df.columns:
-                df[x] = 0
-        return df
+# Browser sessions and debug files are keyed by flow run, so concurrent runs in one process stay apart.
+def run_key():
+    return str(flow_run.id) if flow_run.id else 'local'
+
 
-    def screenshot(filepath_html, filepath_png):
-        filepath_html = os.path.realpath(filepath_html)
-        # filepath_html = 'file:\\\\' + filepath_html
-        filepath_html = 'file://' + filepath_html
-        with ChromeDriver(no_sandbox=True, window_size='1920,1080', use_chromium=True, headless=True) as driver:
-            driver.get(filepath_html)
-            chart = driver.find_element(by='xpath', value='/html/body/table')
-            chart.screenshot(filepath_png)
+# Fetch and views are reused only within one flow run, e.g. when the run is retried. A new run always reads
+# fresh data, even in the same month, so a re-run after an upstream fix never emails the old numbers.
+def run_input_hash(context, parameters):
+    key = task_input_hash(context, parameters)
+    return None if key is None else f"{context.task_run.flow_run_id}-{key}"
 
 
-    #%% Get Actuals Data
+#%% Tasks
 
-    df = con.read("""
-    SELECT effective_date
-        , new_category
-        , amount
-    FROM `bbg-platform.analytics.v_dashboard_revenue`;
-    """)
+# One task for every (eom, budget_year, end, budget) period the reports need, so the raw revenue is read at most once.
+# The prior-year side and the budget table come from the baseline cache after the first run in a period.
+# In store mode only the restated days are re-read, every period is then queried from the daily store.
+@task(log_prints=True, retries=2, retry_delay_seconds=30, cache_key_fn=run_input_hash, cache_expiration=dt.timedelta(hours=1), persist_result=True)
+def fetch_dash_data(periods, aggregate_mode='store', incremental=True, restatement_days=dash_config.RESTATEMENT_DAYS, compact=True, use_baseline_cache=True):
+    import revenue_data
+    import dash_compare
+    import dash_store
 
-    df['effective_date'] = pd.to_datetime(df['effective_date'])
-    df['yrmnth'] = df['effective_date'].dt.to_period('M')
+    con = get_bigquery_con()
+    raw = []
 
+    def read_raw():
+        if raw:
+            return raw[0]
+        with dash_metrics.span('load') as s:
+            if incremental:
+                df = revenue_data.read_revenue_incremental(con, restatement_days=restatement_days, compact=compact)
+            else:
+                df = revenue_data.read_revenue(con, compact=compact)
+            s.rows = len(df)
+        if compact and aggregate_mode == 'compare':
+            print(revenue_data.memory_report(df))
+        raw.append(df)
+        return df
 
-    #%% Get Budget Data
-
-    # df_budget = con.read("""
-    # select eom
-    #   , category_budget
-    #   , sum(amount) as amount
-    # from `bbg-platform.analytics_stage.fct_budget_2023`
-    # group by 1, 2
-    # order by 1, 2;
-    # """)
+    dash_data = []
+    with dash_metrics.span('fetch_' + aggregate_mode) as s:
+        store = None
+        if aggregate_mode == 'store':
+            store = dash_store.DailyStore()
+            with dash_metrics.span('store_refresh'):
+                store.refresh(con, restatement_days, full_refresh=not incremental)
+        for eom, budget_year, end, budget in periods:
+            df_day, df_month = dash_compare.read_aggregates(con, eom, budget_year, mode=aggregate_mode, read_raw=read_raw, end=end, use_cache=use_baseline_cache, store=store)
+            df_budget = dash_compare.read_budget_cached(con, eom.year, use_cache=use_baseline_cache) if budget else None
+            dash_data.append((df_day, df_month, df_budget))
+        s.rows = sum(len(df_day) + len(df_month) for df_day, df_month, _ in dash_data)
+    return dash_data
+
+
+# Views of every category layout ({layout: (cat_list, filter_categories, comparison)}) that shares this period and grouping.
+@task(log_prints=True, cache_key_fn=run_input_hash, cache_expiration=dt.timedelta(hours=1), persist_result=True)
+def aggregate_dash_data(dash_data, period, eom, recent_date, peom, budget_year, layouts, group_map=None):
+    import dash_views
+
+    df_day, df_month, df_budget = dash_data[period]
+    with dash_metrics.span('views', rows=len(df_day) + len(df_month)):
+        df_day = dash_views.group_categories(df_day, group_map, 'effective_date')
+        df_month = dash_views.group_categories(df_month, group_map, 'yrmnth')
+        if df_budget is not None:
+            df_budget = dash_views.group_categories(df_budget, group_map, 'yrmnth')
+        return dash_views.layout_views(df_day, df_month, eom, recent_date, peom, budget_year, layouts, df_budget)
+
+
+# Unchanged images are served by the content-addressed render cache rather than Prefect's result cache.
+@task(log_prints=True, retries=2, retry_delay_seconds=10)
+def render_dash_artifact(layout_views, layout, name, cat_list, renderer=dash_config.DEFAULT_TABLE_RENDERER, use_render_cache=True, spill_dir=None):
+    import dash_render
+    import browser_session
+    import render_cache
+
+    browser = browser_session.shared_session(run_key()) if renderer == 'html' else None
+    cache = render_cache.default_cache() if use_render_cache else None
+    with dash_metrics.span('render_' + name):
+        return dash_render.render_artifact(name, layout_views[layout], cat_list, renderer=renderer, browser=browser, cache=cache, spill_dir=spill_dir)
+
+
+# Shrinks the images before they are attached; fails the report rather than send a message over budget_kb.
+@task(log_prints=True)
+def optimize_dash_images(artifacts, budget_kb=dash_config.EMAIL_BUDGET_KB):
+    import dash_render
+    import dash_images
 
-    # df_budget['eom'] = pd.to_datetime(df_budget['eom'])
-    # df_budget['yrmnth'] = df_budget['eom'].dt.to_period('M')
+    with dash_metrics.span('optimize_images', rows=len(artifacts)):
+        optimized, report = dash_render.optimize_dashboard(artifacts, budget_kb)
+    dash_images.print_report(report)
+    return optimized
 
-    df_budget = df[df['effective_date'].dt.year == dt.datetime.now().year - 1]
-    df_budget = df_budget.groupby(['yrmnth', 'new_category'])['amount'].sum()
-    df_budget = pd.DataFrame(df_budget).reset_index()
-    df_budget.rename({'yrmnth':'eom', 'new_category':'category_budget'}, axis=1, inplace=True)
-    df_budget['eom'] = df_budget['eom'].apply(lambda x: x.to_timestamp() + pd.offsets.MonthEnd(0))
 
+# Transient SMTP failures are retried per batch inside the task. A task retry resends only the batches the
+# server hasn't accepted, and never re-renders since the images arrive as bytes.
+@task(log_prints=True, retries=2, retry_delay_seconds=60)
+def send_dash_email(artifacts, report_date, subject='MM Daily Dash', recipients_variable='email_cash_dash', report_name='cash_dash'):
+    import dash_email
+    import dash_reports
 
-    #%% Daily Data ################################################################################################################
+    email_value = resources.gmail_settings()
+    EMAIL_UID = email_value.get("EMAIL_UID")
+    EMAIL_PWD = email_value.get("EMAIL_PWD")
 
-    eom = dt.date.today() + dt.timedelta(days=-1) + pd.offsets.MonthEnd(0)
-    recent_date = eom + pd.offsets.MonthBegin(-1)
-    recent_date = dt.datetime(recent_date.year, recent_date.month, recent_date.day)
-    peom = eom + pd.offsets.MonthEnd(-12)
-
-    dfs = df[df['effective_date'] >= recent_date]
-    dfs = dfs.pivot(index='effective_date', columns='new_category', values='amount')
-    dfs.index = dfs.index.date
-
-    dfg_aggr = dfs.sum(axis=0, numeric_only=True)
-    dfg_aggr = pd.DataFrame(dfg_aggr).T
-    dfg_aggr.index = ['Total']
-
-    dfg_all = pd.concat([dfs, dfg_aggr])
-    dfg_all.columns.name = None
-
-    dfg_aggc = dfg_all.sum(axis=1, numeric_only=True)
-    dfg_aggc = pd.DataFrame(dfg_aggc, index=dfg_all.index, columns=['Total'])
-
-    dfg_all = pd.concat([dfg_all, dfg_aggc], axis=1)
-    dfg_all = dfg_all.reset_index(drop=False, names='Date')
-    dfg_all = df_add_missing_clmns(dfg_all)
-    dfg_all = dfg_all[['Date'] + cat_list + ['Total']]
-
-
-    # Month's budget Chart
-    dfs_budget = pd.DataFrame()
-    dfs_budget.index = dfs.index
-    dfs_budget['budget'] = df_budget[df_budget['eom'] == peom]['amount'].sum()
-
-    # Month's budget Table
-    dfg_aggr_budget = df_budget[df_budget['eom'] == peom][['category_budget', 'amount']]
-    dfg_aggr_budget.set_index('category_budget', inplace=True)
-    dfg_aggr_budget = pd.concat([dfg_aggr, dfg_aggr_budget.T], axis=0)
-    dfg_aggr_budget = dfg_aggr_budget.fillna(0)
-    dfg_aggr_budget['Total'] = dfg_aggr_budget.sum(axis=1)
-    dfg_aggr_diff = dfg_aggr_budget.iloc[0] - dfg_aggr_budget.iloc[1]
-    dfg_aggr_budget = pd.concat([dfg_aggr_budget, pd.DataFrame(dfg_aggr_diff).T])
-    dfg_aggr_budget.index = ['Current Year', 'Prior Year', 'Variance']
-    for x in cat_list:
-        if x not in dfg_aggr_budget.columns:
-            dfg_aggr_budget[x] = 0
-    dfg_aggr_budget = dfg_aggr_budget[cat_list + ['Total']]
-    dfg_aggr_budget.reset_index(inplace=True, names='Type')
-
-
-    #%% Daily Chart ################################################################################################################
-
-    filepath_day_chart = './day_chart.png'
-
-    x = date2num(dfs.index)
-
-    # Daily Bars
-    fig, ax = plt.subplots(figsize=(10, 4.8))
-    ax.bar(x, height=dfs.sum(axis=1), label='Daily Total')
-    for i, y in enumerate(dfs.sum(axis=1)):
-        ax.annotate('{:,.0f}'.format(y*1e-3), (x[i], y), ha='center', va='bottom')
-
-    # Cumulative Line
-    ax.plot(x, dfs.sum(axis=1).cumsum(), color='black', label='MTD Total')
-    i, y = list(enumerate(dfs.sum(axis=1).cumsum()))[-1]
-    ax.annotate('{:,.1f}M'.format(y*1e-6), (x[i], y), ha='left', va='center')
-
-    ax.plot(x, dfs_budget, color='red', ls='--', label='Prior Year')
-    i, y = list(enumerate(dfs_budget['budget']))[0]
-    ax.annotate('{:,.1f}M'.format(y*1e-6), (x[i], y), ha='right', va='center', color='red')
-
-    # Formatting
-    ax.set_title('Current Month Cash', loc='center')
-    ax.set_xlabel('Day')
-    ax.set_ylabel("Dollars in thousands")
-    ax.legend(loc='best')
-
-    ax.yaxis.set_major_formatter(lambda x, pos: '{:,.0f}'.format(x*1e-3))
-    ax.xaxis_date()
-    fig.autofmt_xdate()
-    plt.tight_layout()
-
-    plt.savefig(filepath_day_chart)
-
-
-    #%% Daily Table ################################################################################################################
-
-    filepath_day_table = './day_table.png'
-    filepath_day_table_html = './day_table.html'
-
-    clmn_format_dict = {}
-    for clmn in cat_list + ['Total']:
-        clmn_format_dict[clmn] = fmt
-
-    dfg_all_formatted = dfg_all.style\
-        .set_caption("Current Month Cash by Product by Day")\
-        .hide(axis="index")\
-        .set_properties(**{'text-align': 'left'})\
-        .set_properties(**{'font-size': '14px;'})\
-        .set_properties(**{'font-family': 'Century Gothic, sans-serif;'})\
-        .set_properties(**{'padding': '3px 20px 3px 5px;'})\
-        .set_table_styles([
-            # Caption
-            {
-                'selector': 'caption',
-                'props': 'font-weight: bold;\
-                    font-size: 18px;\
-                    font-family: Century Gothic, sans-serif;\
-                    padding: 0px 0px 5px 0px;'
-            },
-            # Column Headers
-            {
-                'selector': 'thead th',
-                'props': 'background-color: #FFFFFF;\
-                    color: #305496;\
-                    border-bottom: 2px solid #305496;\
-                    text-align: left;\
-                    font-size: 14px;\
-                    font-family: Century Gothic, sans-serif;\
-                    padding: 0px 20px 0px 5px;'
-            },
-            # Last Column Header
-            {
-                'selector': 'thead th:last-child',
-                'props': 'color: black;'
-            },
-            # Even Rows
-            {
-                'selector': 'tbody tr:nth-child(even)',
-                'props': 'background-color: white;\
-                    color: black;'
-            },
-            # Odd Rows
-            {
-                'selector': 'tbody tr:nth-child(odd)',
-                'props': 'background-color: #D9E1F2;'
-            },
-            # Last Row
-            {
-                'selector': 'tbody tr:last-child td',
-                'props': 'font-weight: bold;\
-                    border-top: 2px solid #305496;'
-            },
-            # First Column
-            {
-                'selector': 'tbody td:first-child',
-                'props': 'border-right: 2px solid #305496;'
-            },
-            # Last Column
-            {
-                'selector': 'tbody td:last-child',
-                'props': 'font-weight: bold;\
-                    border-left: 2px solid #305496;'
-            },
-            ])\
-        .format(clmn_format_dict)
-
-    # dfi.export(dfg_all_formatted, filepath_day_table)
-
-    with open(filepath_day_table_html, 'w') as f:
-        html = dfg_all_formatted.to_html()
-        html = html.replace('<style type="text/css">', '<style type="text/css">\ntable {\n\tborder-spacing: 0;\n}')
-        f.write(html)
-
-    screenshot(filepath_day_table_html, filepath_day_table)
-
-
-    #%% MTD Budget Table ################################################################################################################
-
-    filepath_budget_table = './mtd_budget_table.png'
-    filepath_budget_table_html = './mtd_budget_table.html'
-
-    clmn_format_dict = {}
-    for clmn in cat_list + ['Total']:
-        clmn_format_dict[clmn] = fmt
-
-    dfg_aggr_budget_formatted = dfg_aggr_budget.style\
-        .set_caption("Current Month Cash by Product vs Prior Year")\
-        .hide(axis="index")\
-        .set_properties(**{'text-align': 'left'})\
-        .set_properties(**{'font-size': '14px;'})\
-        .set_properties(**{'font-family': 'Century Gothic, sans-serif;'})\
-        .set_properties(**{'padding': '3px 20px 3px 5px;'})\
-        .set_table_styles([
-            # Caption
-            {
-                'selector': 'caption',
-                'props': 'font-weight: bold;\
-                    font-size: 18px;\
-                    font-family: Century Gothic, sans-serif;\
-                    padding: 0px 0px 5px 0px;'
-            },
-            # Column Headers
-            {
-                'selector': 'thead th',
-                'props': 'background-color: #FFFFFF;\
-                    color: #305496;\
-                    border-bottom: 2px solid #305496;\
-                    text-align: left;\
-                    font-size: 14px;\
-                    font-family: Century Gothic, sans-serif;\
-                    padding: 0px 20px 0px 5px;'
-            },
-            # Last Column Header
-            {
-                'selector': 'thead th:last-child',
-                'props': 'color: black;'
-            },
-            # Even Rows
-            {
-                'selector': 'tbody tr:nth-child(even)',
-                'props': 'background-color: white;\
-                    color: black;'
-            },
-            # Odd Rows
-            {
-                'selector': 'tbody tr:nth-child(odd)',
-                'props': 'background-color: #D9E1F2;'
-            },
-            # Last Row
-            {
-                'selector': 'tbody tr:last-child td',
-                'props': 'font-weight: bold;\
-                    border-top: 2px solid #305496;'
-            },
-            # First Column
-            {
-                'selector': 'tbody td:first-child',
-                'props': 'border-right: 2px solid #305496;'
-            },
-            # Last Column
-            {
-                'selector': 'tbody td:last-child',
-                'props': 'font-weight: bold;\
-                    border-left: 2px solid #305496;'
-            },
-            ])\
-        .format(clmn_format_dict)
-
-    # dfi.export(dfg_all_formatted, filepath_day_table)
-
-    with open(filepath_budget_table_html, 'w') as f:
-        html = dfg_aggr_budget_formatted.to_html()
-        html = html.replace('<style type="text/css">', '<style type="text/css">\ntable {\n\tborder-spacing: 0;\n}')
-        f.write(html)
-
-    screenshot(filepath_budget_table_html, filepath_budget_table)
-
-
-    #%% Monthly Data ################################################################################################################
-
-    dfg = df[df['yrmnth'].dt.year == eom.year]
-    dfg = dfg.groupby(['new_category', 'yrmnth'])['amount'].sum()
-    dfg = dfg.reset_index(drop=False)
-    dfg = dfg.sort_values('new_category')
-    dfg = dfg.pivot(index='yrmnth', columns='new_category', values='amount')
-    dfg = df_add_missing_clmns(dfg)
-    dfg = dfg[cat_list]
-
-    dfg_aggr = dfg.sum(axis=0, numeric_only=True)
-    dfg_aggr = pd.DataFrame(dfg_aggr).T
-    dfg_aggr.index = ['Total']
-
-    dfg_all = pd.concat([dfg, dfg_aggr])
-    dfg_all.columns.name = None
-
-    dfg_aggc = dfg_all.sum(axis=1, numeric_only=True)
-    dfg_aggc = pd.DataFrame(dfg_aggc, index=dfg_all.index, columns=['Total'])
-
-    dfg_all = pd.concat([dfg_all, dfg_aggc], axis=1)
-    dfg_all = dfg_all.reset_index(drop=False, names='Date')
-    dfg_all = df_add_missing_clmns(dfg_all)
-    dfg_all = dfg_all[['Date'] + cat_list + ['Total']]
-
-
-    # Cumulative Budget
-    dfg_budget = pd.DataFrame()
-    dfg_budget.index = dfg.index
-    dfg_budget = df_budget[df_budget['eom'] <= peom]
-    dfg_budget = dfg_budget[['eom', 'amount']]
-    dfg_budget.set_index('eom', inplace=True)
-    dfg_budget = dfg_budget.groupby('eom')['amount'].sum().cumsum()
-    dfg_budget = pd.DataFrame(dfg_budget)
-
-    # YTD budget Table
-    dfg_aggr_budget = df_budget[df_budget['eom'] <= peom].groupby('category_budget')['amount'].sum()
-    dfg_aggr_budget = pd.DataFrame(dfg_aggr_budget)
-    dfg_aggr_budget = pd.concat([dfg_aggr, dfg_aggr_budget.T], axis=0)
-    dfg_aggr_budget = dfg_aggr_budget.fillna(0)
-    dfg_aggr_budget['Total'] = dfg_aggr_budget.sum(axis=1)
-    dfg_aggr_diff = dfg_aggr_budget.iloc[0] - dfg_aggr_budget.iloc[1]
-    dfg_aggr_budget = pd.concat([dfg_aggr_budget, pd.DataFrame(dfg_aggr_diff).T])
-    dfg_aggr_budget.index = ['Current Year', 'Prior Year', 'Variance']
-    dfg_aggr_budget = dfg_aggr_budget[cat_list + ['Total']]
-    dfg_aggr_budget.reset_index(inplace=True, names='Type')
-
-
-    #%% Monthly Chart ################################################################################################################
-
-    filepath_month_chart = './month_chart.png'
-
-    x = dfg.index.astype(str)
-
-    fig, ax = plt.subplots()
-
-    # Monthly Bars
-    ax.bar(x, dfg.sum(axis=1), label='Monthly Total')
-    for i, y in enumerate(dfg.sum(axis=1)):
-        ax.annotate('{:,.1f}'.format(y*1e-6), (x[i], y), ha='center', va='bottom')
-
-    # Cumulative Line
-    ax.plot(x, dfg.sum(axis=1).cumsum(), color='black', label='YTD Total')
-    i, y = list(enumerate(dfg.sum(axis=1).cumsum()))[-1]
-    ax.annotate('{:,.1f}'.format(y*1e-6), (x[i], y), ha='left', va='center')
-
-    # Budget Line
-    ax.plot(x, dfg_budget['amount'], color='red', ls='--', label='Prior Year')
-    i, y = list(enumerate(dfg_budget['amount']))[-1]
-    ax.annotate('{:,.1f}'.format(y*1e-6), (x[i], y), ha='left', va='center', color='red')
-
-    ax.set_title('Cash by Month', loc='center')
-    ax.set_ylabel('Dollars in millions')
-    ax.set_xlabel('Month')
-    ax.legend(loc='best')
-
-    ax.yaxis.set_major_formatter(lambda x, pos: '{:,.0f}'.format(x*1e-6))
-    plt.xticks(rotation=45)
-    plt.tight_layout()
-
-    plt.savefig(filepath_month_chart)
-
-
-    #%% Monthly Table ################################################################################################################
-
-    filepath_month_table = './month_table.png'
-    filepath_month_table_html = './month_table.html'
-
-    fmt = lambda x: '-' if pd.isna(x) else '${:,.0f}'.format(x) if x >= 0 else '$({:,.0f})'.format(abs(x))
-
-    clmn_format_dict = {}
-    for clmn in cat_list + ['Total']:
-        clmn_format_dict[clmn] = fmt
-
-
-    dfg_all_formatted = dfg_all.style\
-        .set_caption("Cash by Product by Month")\
-        .hide(axis="index")\
-        .set_properties(**{'text-align': 'left'})\
-        .set_properties(**{'font-size': '14px;'})\
-        .set_properties(**{'font-family': 'Century Gothic, sans-serif;'})\
-        .set_properties(**{'padding': '3px 20px 3px 5px;'})\
-        .set_table_styles([
-            # Caption
-            {
-                'selector': 'caption',
-                'props': 'font-weight: bold;\
-                    font-size: 18px;\
-                    font-family: Century Gothic, sans-serif;\
-                    padding: 0px 0px 5px 0px;'
-            },
-            # Column Headers
-            {
-                'selector': 'thead th',
-                'props': 'background-color: #FFFFFF;\
-                    color: #305496;\
-                    border-bottom: 2px solid #305496;\
-                    text-align: left;\
-                    font-size: 14px;\
-                    font-family: Century Gothic, sans-serif;\
-                    padding: 0px 20px 0px 5px;'
-            },
-            # Last Column Header
-            {
-                'selector': 'thead th:last-child',
-                'props': 'color: black;'
-            },
-            # Even Rows
-            {
-                'selector': 'tbody tr:nth-child(even)',
-                'props': 'background-color: white;\
-                    color: black;'
-            },
-            # Odd Rows
-            {
-                'selector': 'tbody tr:nth-child(odd)',
-                'props': 'background-color: #D9E1F2;'
-            },
-            # Last Row
-            {
-                'selector': 'tbody tr:last-child td',
-                'props': 'font-weight: bold;\
-                    border-top: 2px solid #305496;'
-            },
-            # First Column
-            {
-                'selector': 'tbody td:first-child',
-                'props': 'border-right: 2px solid #305496;'
-            },
-            # Last Column
-            {
-                'selector': 'tbody td:last-child',
-                'props': 'font-weight: bold;\
-                    border-left: 2px solid #305496;'
-            },
-            ])\
-        .format(clmn_format_dict)
-        
-    # dfi.export(dfg_all_formatted, filepath_month_table)
-
-    with open(filepath_month_table_html, 'w') as f:
-        html = dfg_all_formatted.to_html()
-        html = html.replace('<style type="text/css">', '<style type="text/css">\ntable {\n\tborder-spacing: 0;\n}')
-        f.write(html)
-
-    screenshot(filepath_month_table_html, filepath_month_table)
-
-
-    #%% YTD Budget Table ################################################################################################################
-
-    filepath_ytd_budget = './ytd_budget.png'
-    filepath_ytd_budget_html = './ytd_budget.html'
-
-    fmt = lambda x: '-' if pd.isna(x) else '${:,.0f}'.format(x) if x >= 0 else '$({:,.0f})'.format(abs(x))
-
-    clmn_format_dict = {}
-    for clmn in cat_list + ['Total']:
-        clmn_format_dict[clmn] = fmt
-
-
-    dfg_all_formatted = dfg_aggr_budget.style\
-        .set_caption("YTD Cash by Product vs Prior Year")\
-        .hide(axis="index")\
-        .set_properties(**{'text-align': 'left'})\
-        .set_properties(**{'font-size': '14px;'})\
-        .set_properties(**{'font-family': 'Century Gothic, sans-serif;'})\
-        .set_properties(**{'padding': '3px 20px 3px 5px;'})\
-        .set_table_styles([
-            # Caption
-            {
-                'selector': 'caption',
-                'props': 'font-weight: bold;\
-                    font-size: 18px;\
-                    font-family: Century Gothic, sans-serif;\
-                    padding: 0px 0px 5px 0px;'
-            },
-            # Column Headers
-            {
-                'selector': 'thead th',
-                'props': 'background-color: #FFFFFF;\
-                    color: #305496;\
-                    border-bottom: 2px solid #305496;\
-                    text-align: left;\
-                    font-size: 14px;\
-                    font-family: Century Gothic, sans-serif;\
-                    padding: 0px 20px 0px 5px;'
-            },
-            # Last Column Header
-            {
-                'selector': 'thead th:last-child',
-                'props': 'color: black;'
-            },
-            # Even Rows
-            {
-                'selector': 'tbody tr:nth-child(even)',
-                'props': 'background-color: white;\
-                    color: black;'
-            },
-            # Odd Rows
-            {
-                'selector': 'tbody tr:nth-child(odd)',
-                'props': 'background-color: #D9E1F2;'
-            },
-            # Last Row
-            {
-                'selector': 'tbody tr:last-child td',
-                'props': 'font-weight: bold;\
-                    border-top: 2px solid #305496;'
-            },
-            # First Column
-            {
-                'selector': 'tbody td:first-child',
-                'props': 'border-right: 2px solid #305496;'
-            },
-            # Last Column
-            {
-                'selector': 'tbody td:last-child',
-                'props': 'font-weight: bold;\
-                    border-left: 2px solid #305496;'
-            },
-            ])\
-        .format(clmn_format_dict)
-        
-    # dfi.export(dfg_all_formatted, filepath_ytd_budget)
-
-    with open(filepath_ytd_budget_html, 'w') as f:
-        html = dfg_all_formatted.to_html()
-        html = html.replace('<style type="text/css">', '<style type="text/css">\ntable {\n\tborder-spacing: 0;\n}')
-        f.write(html)
-
-    screenshot(filepath_ytd_budget_html, filepath_ytd_budget)
-
-
-    #%% Send Email Update ################################################################################################################
-
-    body = ["Good morning!  Here is today's update:",
-            "",
-            "",
-            filepath_day_chart,
-            "",
-            filepath_budget_table,
-            "",
-            filepath_day_table,
-            "",
-            filepath_month_chart,
-            "",
-            filepath_ytd_budget,
-            "",
-            filepath_month_table,
-            "Have a great day!"
-    ]
-
-    SendEmail(to_email_addresses=EMAIL_FAIL
-            , subject= 'MM Daily Dash - ' + dt.date.today().strftime('%m-%d-%Y')
-            , body=body
-            , user=EMAIL_UID
-            , password=EMAIL_PWD
-            , bcc_email_addresses=EMAIL_SEND
-            )
-
-
-def run_email_cash_dash():
-    if asyncio.run(check_good_data.get_data_status()):
-        run_email_cash_dash_task()
+    var1 = resources.variable('email_fail_notifications')
+    EMAIL_FAIL = var1['EMAIL_FAIL']
+
+    var1 = resources.variable(recipients_variable)
+    if not var1 or 'EMAIL_SEND' not in var1:
+        raise ValueError(f'recipients variable {recipients_variable} is invalid, please set it to {{"EMAIL_SEND": "a@x.com,b@x.com"}}')
+    EMAIL_SEND = var1['EMAIL_SEND']
+
+    body = dash_reports.email_body(list(artifacts))
+
+    # EMAIL_FAIL is the visible To, everyone in EMAIL_SEND only appears on the envelope like a bcc.
+    data = dash_email.build_message(artifacts, body
+                                    , subject=subject + ' - ' + report_date.strftime('%m-%d-%Y')
+                                    , sender=EMAIL_UID
+                                    , to=EMAIL_FAIL)
+    recipients = list(dict.fromkeys(dash_email.split_addresses(EMAIL_FAIL) + dash_email.split_addresses(EMAIL_SEND)))
+
+    with dash_metrics.span('email', rows=len(recipients)):
+        refused = dash_email.deliver(data, recipients, EMAIL_UID, EMAIL_PWD, key=f"{run_key()}:{report_name}:{report_date}")
+    print(f"Sent {len(data) / 1024:,.0f} KB to {len(recipients) - len(refused)} of {len(recipients)} recipients")
+
+
+#%% Flow
+
+# fetch once -> views per report layout -> every image of every report in parallel -> optimize + email per report
+def run_email_cash_dash_task(as_of=None, aggregate_mode='store', incremental=True, restatement_days=dash_config.RESTATEMENT_DAYS, compact=True, table_renderers=None, use_render_cache=True, debug_dir=DEBUG_DIR
+                             , email_budget_kb=dash_config.EMAIL_BUDGET_KB, reports=None, segments=None, use_baseline_cache=True):
+    dash_metrics.start_run()
+    try:
+        with dash_metrics.span('run'):
+            email_cash_dash(as_of, aggregate_mode, incremental, restatement_days, compact, table_renderers, use_render_cache, debug_dir, email_budget_kb, reports, segments, use_baseline_cache)
+    finally:
+        dash_metrics.publish_run()
+
+
+# Reports that need the same period, category grouping, layout or image share the fetch, views and render futures.
+# segments adds one filtered copy of the cash dash per recipient group (default: the cash_dash_segments Variable).
+def email_cash_dash(as_of, aggregate_mode, incremental, restatement_days, compact, table_renderers, use_render_cache, debug_dir, email_budget_kb, reports=None, segments=None, use_baseline_cache=True):
+    import dash_views
+    import dash_render
+    import dash_reports
+    import dash_compare
+    import browser_session
+
+    table_renderers = table_renderers or {}
+    reports = dash_reports.select_reports(resources.variable(dash_reports.REPORTS_VARIABLE, default=[]), reports)
+    if segments is None:
+        segments = resources.variable(dash_reports.SEGMENTS_VARIABLE, default={})
+    reports += dash_reports.segment_reports(segments)
+    dash_reports.validate_reports(reports, list(dash_render.DASH_ARTIFACTS))
+
+    var1 = resources.variable('cash_dash_categories')
+    default_categories = var1['CAT_LIST'].split(',')
+    base_date = as_of or dt.date.today()
+
+    # Plan every report before submitting anything, so each period is fetched in a single task and the views
+    # of every layout sharing a period and grouping come from a single cube.
+    plans, periods, cubes, layouts, budget_periods = {}, {}, {}, {}, set()
+    for report in reports:
+        report_date = report.report_date(base_date)
+        end = as_of if report.lag_days == 0 else report_date
+        eom, recent_date, peom = dash_views.dash_dates(report_date)
+        budget_year = report_date.year - 1
+        period = periods.setdefault(dash_reports.fetch_key(eom, budget_year, end), len(periods))
+        if dash_compare.COMPARISON_SOURCES[report.comparison] == 'budget':
+            budget_periods.add(period)
+        cat_list = report.cat_list(default_categories)
+        cube = dash_reports.cube_key(period, report.groups)
+        cubes.setdefault(cube, (period, eom, recent_date, peom, budget_year, {}, report.group_map()))
+        layout = layouts.setdefault(dash_reports.views_key(cube, cat_list, report.filter_categories, report.comparison), len(layouts))
+        cubes[cube][5][layout] = (cat_list, report.filter_categories, report.comparison)
+        plans[report.name] = (report_date, cat_list, cube, layout)
+
+    fetches = [(*key, period in budget_periods) for key, period in periods.items()]
+    dash_data = fetch_dash_data.submit(fetches, aggregate_mode, incremental, restatement_days, compact, use_baseline_cache)
+    views = {cube: aggregate_dash_data.submit(dash_data, *args) for cube, args in cubes.items()}
+
+    renders, report_renders = {}, {}
+    try:
+        for report in reports:
+            report_date, cat_list, cube, layout = plans[report.name]
+            spill_dir = os.path.join(debug_dir, f"{report_date:%Y-%m-%d}_{run_key()}", report.name) if debug_dir else None
+            report_renders[report.name] = {}
+            for name in report.artifacts:
+                renderer = report.renderer(name, table_renderers, dash_config.DEFAULT_TABLE_RENDERER)
+                render_key = dash_reports.render_key(layout, name, renderer)
+                if render_key not in renders:
+                    renders[render_key] = render_dash_artifact.submit(views[cube], layout, name, cat_list, renderer, use_render_cache, spill_dir)
+                report_renders[report.name][name] = renders[render_key]
+        for future in renders.values():
+            future.wait()
+    finally:
+        browser_session.close_shared_session(run_key())
+
+    print(f"{len(reports)} reports: {len(periods)} fetch periods, {len(cubes)} cubes, {len(layouts)} layouts, {len(renders)} renders")
+
+    # A report that fails to render or send doesn't stop the others, the run fails once they have all finished.
+    sends = {}
+    for report in reports:
+        report_date = plans[report.name][0]
+        artifacts = optimize_dash_images.submit(report_renders[report.name], email_budget_kb)
+        sends[report.name] = send_dash_email.submit(artifacts, report_date, report.subject, report.recipients_variable, report.name)
+    failed = []
+    for name, future in sends.items():
+        try:
+            future.result()
+        except Exception as e:
+            print(f"Report {name} failed: {type(e).__name__}: {e}")
+            failed.append(name)
+    if failed:
+        raise RuntimeError(f"Reports failed: {', '.join(failed)}")
+
+
+# Waits up to wait_minutes for a dbt run that completed and started after data_cutoff (default: midnight
+# of the report date), then sends every configured report (or just the ones named in reports) and one filtered
+# copy per recipient group in segments straight away. Historical as_of runs don't wait. A data_cutoff without a
+# timezone is taken as local time. Running out of time fails the run, so the missing email gets noticed.
+@flow(log_prints=True, task_runner=ThreadPoolTaskRunner(max_workers=dash_config.MAX_WORKERS))
+def run_email_cash_dash(as_of: dt.date | None = None, aggregate_mode='store', incremental=True, restatement_days=dash_config.RESTATEMENT_DAYS, compact=True, table_renderers=None, use_render_cache=True
+                        , wait_minutes: float = 180, data_cutoff: dt.datetime | None = None, debug_dir: str | None = DEBUG_DIR, email_budget_kb: float = dash_config.EMAIL_BUDGET_KB
+                        , reports: list[str] | None = None, segments: dict[str, list[str]] | None = None, use_baseline_cache=True):
+    if as_of is None:
+        data_cutoff = data_cutoff or dt.datetime.combine(dt.date.today(), dt.time())
+        if data_cutoff.tzinfo is None:
+            data_cutoff = data_cutoff.astimezone()
+        deadline = dt.datetime.now(dt.timezone.utc) + dt.timedelta(minutes=wait_minutes)
+        deployments, tables, bq_client = freshness_signals()
+    if as_of is not None or asyncio.run(check_good_data.wait_for_data(deadline, data_cutoff, deployments, tables, bq_client)):
+        run_email_cash_dash_task(as_of, aggregate_mode, incremental, restatement_days, compact, table_renderers, use_render_cache, debug_dir, email_budget_kb, reports, segments, use_baseline_cache)
     else:
-        print("Data is not ready, skipping email cash dash.")
+        raise RuntimeError(f"Data is not ready after waiting {wait_minutes:g} minutes, email cash dash not sent")
+
+
+# Loads the revenue history once and renders one output directory per day, without sending email.
+@flow(log_prints=True)
+def backfill_email_cash_dash(start: dt.date, end: dt.date, output_dir='./backfill', max_workers: int | None = None, table_renderers=None):
+    import revenue_data
+    import dash_backfill
+
+    var1 = resources.variable('cash_dash_categories')
+    cat_list = var1['CAT_LIST'].split(',')
+
+    con = get_bigquery_con()
+    df = revenue_data.read_revenue_incremental(con, compact=True)
+
+    filepaths = dash_backfill.backfill(df, start, end, output_dir, cat_list, table_renderers, max_workers)
+    print(f"Backfilled {len(filepaths)} days into {output_dir}")
+    return filepaths
 
 
 if __name__ == '__main__':
-    run_email_cash_dash.serve(name='email-cash-dash-local')
+    from prefect import serve
+
+    serve(
+        run_email_cash_dash.to_deployment(name='email-cash-dash-local'),
+        backfill_email_cash_dash.to_deployment(name='email-cash-dash-backfill-local'),
+    )
 
 
-# %%
\ No newline at end of file
+# %%
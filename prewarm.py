@@ -0,0 +1,106 @@
+#%% Imports
+
+import io
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import warnings
+import sysconfig
+import compileall
+import subprocess
+
+
+# Run while the image is built, so a fresh container doesn't pay for these before its first query:
+#   python prewarm.py --steps fonts bytecode    (right after pip install, needs only this file)
+#   python prewarm.py --steps app chromium      (after the flow code is copied in)
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+STEPS = ['fonts', 'bytecode', 'app', 'chromium']
+
+
+#%% Steps
+
+# Builds matplotlib's font cache (under MPLCONFIGDIR) and resolves the family the charts and raster tables use.
+# Uses matplotlib directly rather than the flow code, so it runs before the code is copied in.
+def warm_fonts():
+    from matplotlib import font_manager
+    from matplotlib.figure import Figure
+
+    for weight in ['normal', 'bold']:
+        font_manager.findfont(font_manager.FontProperties(family=['Century Gothic', 'sans-serif'], weight=weight))
+    fig = Figure(figsize=(2, 1))
+    fig.subplots().set_title('prewarm')
+    fig.savefig(io.BytesIO(), format='png')
+
+
+# Byte-compiles paths in parallel, skipping anything already compiled. Some packages ship files that
+# aren't meant to compile, so failures are left to the import that needs them.
+def compile_paths(paths):
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        for path in paths:
+            if os.path.isdir(path):
+                compileall.compile_dir(path, quiet=2, workers=0)
+
+
+# pip compiles what it installs, this picks up whatever it skipped in site-packages.
+def compile_bytecode():
+    compile_paths(dict.fromkeys(sysconfig.get_paths()[key] for key in ['purelib', 'platlib']))
+
+
+def compile_app():
+    compile_paths([APP_DIR])
+
+
+# Launches Chromium once against profile_dir so its first-run setup lands in the image. Skipped in images
+# built without Chromium or without a profile directory, BrowserSession then starts from a fresh profile as before.
+def init_chromium_profile(profile_dir, binary=None, timeout=120):
+    import browser_session
+
+    binary = binary or browser_session.CHROMIUM_BINARY
+    if not profile_dir:
+        print("No CASH_DASH_CHROME_PROFILE set, skipping the profile")
+        return False
+    if shutil.which(binary) is None:
+        print(f"Chromium not found at {binary}, skipping the profile")
+        return False
+    os.makedirs(profile_dir, exist_ok=True)
+    subprocess.run([binary, '--headless=new', '--no-sandbox', '--disable-gpu', '--disable-dev-shm-usage'
+                    , f'--user-data-dir={profile_dir}', '--dump-dom', 'about:blank']
+                   , check=True, timeout=timeout, capture_output=True)
+    # Left behind by the launch, would make every copy look like a profile already in use.
+    for name in ['SingletonLock', 'SingletonSocket', 'SingletonCookie']:
+        path = os.path.join(profile_dir, name)
+        if os.path.lexists(path):
+            os.remove(path)
+    return True
+
+
+def chrome_profile():
+    import browser_session
+    return browser_session.CHROME_PROFILE
+
+
+def prewarm(steps=STEPS, profile_dir=None):
+    actions = {'fonts': warm_fonts, 'bytecode': compile_bytecode, 'app': compile_app
+               , 'chromium': lambda: init_chromium_profile(profile_dir or chrome_profile())}
+    results = []
+    for step in steps:
+        start = time.perf_counter()
+        done = actions[step]()
+        results.append({'step': step, 'seconds': round(time.perf_counter() - start, 3), 'done': done is not False})
+        print('prewarm ' + json.dumps(results[-1]), flush=True)
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Prewarm the font cache, bytecode and Chromium profile at image build time.')
+    parser.add_argument('--steps', nargs='+', choices=STEPS, default=STEPS)
+    parser.add_argument('--profile-dir', default=None)
+    args = parser.parse_args()
+
+    sys.path.insert(0, APP_DIR)
+    prewarm(args.steps, args.profile_dir)
@@ -0,0 +1,117 @@
+#%% Imports
+
+import os
+import shutil
+import hashlib
+import threading
+import pandas as pd
+import revenue_data
+
+
+# Under the revenue cache directory unless set.
+RENDER_CACHE_DIR = os.getenv('CASH_DASH_RENDER_CACHE_DIR', os.path.join(revenue_data.CACHE_DIR, 'renders'))
+RENDER_CACHE_MB = float(os.getenv('CASH_DASH_RENDER_CACHE_MB', '200'))
+
+
+#%% Keys
+
+def hash_frame(h, obj):
+    if isinstance(obj, (pd.DataFrame, pd.Series)):
+        h.update(repr((type(obj).__name__, getattr(obj, 'name', None), list(map(str, getattr(obj, 'columns', []))))).encode())
+        h.update(repr([str(x) for x in (obj.dtypes if isinstance(obj, pd.DataFrame) else [obj.dtype])]).encode())
+        h.update(pd.util.hash_pandas_object(obj, index=True).to_numpy().tobytes())
+    else:
+        h.update(repr(obj).encode())
+
+
+# Any change to the drawing code or styling changes every key, so stale images are never served.
+def source_fingerprint(modules):
+    h = hashlib.sha256()
+    for module in modules:
+        with open(module.__file__, 'rb') as f:
+            h.update(f.read())
+    return h.hexdigest()
+
+
+def render_key(*parts):
+    h = hashlib.sha256()
+    for part in parts:
+        hash_frame(h, part)
+    return h.hexdigest()[:32]
+
+
+#%% Cache
+
+def write_bytes(path, data):
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+# One directory per key holding the rendered PNG, least recently used keys are evicted past max_mb.
+class RenderCache:
+    def __init__(self, cache_dir=RENDER_CACHE_DIR, max_mb=RENDER_CACHE_MB):
+        self.cache_dir = cache_dir
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self._lock = threading.Lock()
+
+    def path(self, key, filename):
+        return os.path.join(self.cache_dir, key, filename)
+
+    def get(self, key, filename):
+        path = self.path(key, filename)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.utime(os.path.dirname(path))
+        except FileNotFoundError:
+            return None
+        return data
+
+    def put(self, key, filename, data):
+        revenue_data.atomic_write(self.path(key, filename), lambda tmp_path: write_bytes(tmp_path, data))
+        self.evict()
+
+    def entries(self):
+        if not os.path.isdir(self.cache_dir):
+            return []
+        entries = []
+        for key in os.listdir(self.cache_dir):
+            key_dir = os.path.join(self.cache_dir, key)
+            try:
+                size = sum(os.path.getsize(os.path.join(key_dir, f)) for f in os.listdir(key_dir))
+                entries.append((os.path.getmtime(key_dir), size, key_dir))
+            except (FileNotFoundError, NotADirectoryError):
+                continue
+        return sorted(entries)
+
+    def evict(self):
+        with self._lock:
+            entries = self.entries()
+            total = sum(size for _, size, _ in entries)
+            for _, size, key_dir in entries:
+                if total <= self.max_bytes:
+                    break
+                shutil.rmtree(key_dir, ignore_errors=True)
+                total -= size
+
+    # Returns the stored PNG bytes on a hit, otherwise renders and stores a copy.
+    def render(self, key, filename, render_fn):
+        cached = self.get(key, filename)
+        if cached is not None:
+            print(f"Render cache hit {filename}: {key}")
+            return cached
+        data = render_fn()
+        self.put(key, filename, data)
+        return data
+
+
+_default_cache = None
+_default_lock = threading.Lock()
+
+
+def default_cache():
+    global _default_cache
+    with _default_lock:
+        if _default_cache is None:
+            _default_cache = RenderCache()
+        return _default_cache
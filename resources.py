@@ -0,0 +1,53 @@
+#%% Imports
+
+import threading
+from prefect.variables import Variable
+from prefect.blocks.system import Secret
+from prefect.runtime import flow_run
+
+
+BIGQUERY_SECRET = 'bbg-bigquery-sa'
+GMAIL_SECRET = 'email-gmail'
+
+
+#%% Cache
+
+_resources = {}
+_resources_lock = threading.RLock()
+
+
+# Loads once per flow run; the tasks and render threads of a run share the same entry. serve() starts every
+# run in a new process anyway, the run id only keeps runs that share a process (local runs) apart.
+def cached(name, loader):
+    key = (flow_run.id, name)
+    with _resources_lock:
+        if key not in _resources:
+            for stale in [k for k in _resources if k[0] != key[0]]:
+                del _resources[stale]
+            _resources[key] = loader()
+        return _resources[key]
+
+
+def clear():
+    with _resources_lock:
+        _resources.clear()
+
+
+#%% Resources
+
+def secret(name):
+    return cached('secret:' + name, lambda: Secret.load(name).get())
+
+
+def variable(name, default=None):
+    return cached('variable:' + name, lambda: Variable.get(name, default=default))
+
+
+# The google client libraries are only imported once a run actually needs BigQuery.
+def bigquery_con():
+    import bigquery_client
+    return cached('bigquery', lambda: bigquery_client.MemorySQL(secret(BIGQUERY_SECRET)))
+
+
+def gmail_settings():
+    return secret(GMAIL_SECRET)
@@ -0,0 +1,130 @@
+#%% Imports
+
+import os
+import tempfile
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+from dash_config import RESTATEMENT_DAYS
+
+
+REVENUE_TABLE = 'bbg-platform.analytics.v_dashboard_revenue'
+
+# Cache should live on a persistent volume, otherwise every container starts cold and does a full read.
+CACHE_DIR = os.getenv('CASH_DASH_CACHE_DIR', './cache')
+CACHE_FILE = 'v_dashboard_revenue.parquet'
+CACHE_FILE_COMPACT = 'v_dashboard_revenue_compact.parquet'
+
+
+#%% Functions
+
+def revenue_sql(where=''):
+    return f"""
+    SELECT effective_date
+        , new_category
+        , amount
+    FROM `{REVENUE_TABLE}`
+    {where};
+    """
+
+
+def read_revenue(con, where='', compact=False):
+    if compact:
+        return read_revenue_arrow(con, where)
+    df = con.read(revenue_sql(where))
+    df['effective_date'] = pd.to_datetime(df['effective_date'])
+    return df
+
+
+#%% Compact Layout
+
+# month_key is year * 12 + month - 1, an integer stand-in for the yrmnth Period column
+def month_key_to_period(month_key):
+    return pd.PeriodIndex.from_ordinals(pd.Series(month_key).to_numpy() - 1970 * 12, freq='M')
+
+
+def compact_revenue(table):
+    effective_date = table['effective_date']
+    amount = pc.cast(table['amount'], pa.float64())
+    return pa.table({
+        'effective_date': effective_date,
+        'new_category': pc.dictionary_encode(table['new_category']),
+        'amount_cents': pc.cast(pc.round(pc.multiply(amount, 100)), pa.int64()),
+        'month_key': pc.cast(pc.add(pc.multiply(pc.year(effective_date), 12), pc.subtract(pc.month(effective_date), 1)), pa.int32()),
+    })
+
+
+# Reads through the BigQuery Storage Read API and keeps the Arrow types: new_category as a
+# categorical, amount as integer cents and month_key as int32.
+def read_revenue_arrow(con, where=''):
+    table = con.client.query(revenue_sql(where)).to_arrow(create_bqstorage_client=True)
+    df = compact_revenue(table).to_pandas(date_as_object=False)
+    df['effective_date'] = pd.to_datetime(df['effective_date'])
+    return df
+
+
+def memory_report(df_compact):
+    df_legacy = pd.DataFrame({
+        'effective_date': df_compact['effective_date'],
+        'new_category': df_compact['new_category'].astype(str).astype(object),
+        'amount': df_compact['amount_cents'] / 100,
+        'yrmnth': df_compact['effective_date'].dt.to_period('M').astype(object),
+    })
+    report = pd.DataFrame({
+        'legacy_bytes': df_legacy.memory_usage(deep=True, index=False),
+        'compact_bytes': pd.Series(df_compact.memory_usage(deep=True, index=False).to_numpy(), index=df_legacy.columns),
+    })
+    report.loc['Total'] = report.sum()
+    report['ratio'] = (report['legacy_bytes'] / report['compact_bytes']).round(1)
+    return report
+
+
+def load_cache(cache_path):
+    if not os.path.exists(cache_path):
+        return None
+    try:
+        return pd.read_parquet(cache_path)
+    except Exception as e:
+        print(f"Unable to read revenue cache {cache_path}, doing a full read: {e}")
+        return None
+
+
+# Every cache file is written through here: write(tmp_path) fills a uniquely named file next to path, which
+# then replaces path in one step. Readers never see a partial file and concurrent runs can't interleave.
+def atomic_write(path, write):
+    cache_dir = os.path.dirname(path) or '.'
+    os.makedirs(cache_dir, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+    os.close(fd)
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def save_cache(df, cache_path):
+    atomic_write(cache_path, lambda tmp_path: df.to_parquet(tmp_path, index=False))
+
+
+def read_revenue_incremental(con, cache_dir=CACHE_DIR, restatement_days=RESTATEMENT_DAYS, full_refresh=False, compact=False):
+    cache_path = os.path.join(cache_dir, CACHE_FILE_COMPACT if compact else CACHE_FILE)
+    df_cache = None if full_refresh else load_cache(cache_path)
+
+    if df_cache is None or df_cache.empty:
+        df = read_revenue(con, compact=compact)
+        print(f"Revenue full read: {len(df):,} rows")
+    else:
+        watermark = df_cache['effective_date'].max()
+        cutoff = watermark - pd.Timedelta(days=restatement_days)
+        df_delta = read_revenue(con, f"WHERE effective_date >= '{cutoff:%Y-%m-%d}'", compact=compact)
+        df_cache = df_cache[df_cache['effective_date'] < cutoff]
+        df = pd.concat([df_cache, df_delta], ignore_index=True)
+        if compact:
+            df['new_category'] = df['new_category'].astype('category')
+        print(f"Revenue incremental read from {cutoff:%Y-%m-%d}: {len(df_delta):,} new rows, {len(df_cache):,} cached rows")
+
+    df = df.sort_values(['effective_date', 'new_category'], ignore_index=True)
+    save_cache(df, cache_path)
+    return df
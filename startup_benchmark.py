@@ -0,0 +1,93 @@
+#%% Imports
+
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+import datetime as dt
+
+
+RESULTS_FILE = 'startup_benchmark.jsonl'
+
+# Steps a fresh container goes through before it can send the dash, each timed from process launch.
+MILESTONES = ['import', 'first_query', 'first_chart', 'first_table', 'first_screenshot']
+
+# Runs in a new interpreter so nothing is already imported, cached or compiled in memory.
+CHILD = """
+import os, sys, json, time
+t0 = float(os.environ['CASH_DASH_STARTUP_T0'])
+milestones = sys.argv[1:]
+
+def mark(name):
+    print('startup ' + json.dumps({'milestone': name, 'seconds': round(time.time() - t0, 4)}), flush=True)
+
+mark('interpreter')
+import prefect_run
+mark('import')
+if 'first_query' in milestones:
+    prefect_run.get_bigquery_con().read('SELECT 1 AS ready;')
+    mark('first_query')
+if 'first_chart' in milestones:
+    import pandas as pd
+    import dash_charts
+    daily = pd.Series([1.0, 2.0, 3.0], index=pd.date_range('2025-01-01', periods=3))
+    dash_charts.day_chart(daily, 6.0)
+    mark('first_chart')
+if 'first_table' in milestones:
+    import pandas as pd
+    import dash_tables
+    dash_tables.render_table_raster(pd.DataFrame({'Date': ['Total'], 'Amount': ['1,234']}), 'Startup')
+    mark('first_table')
+if 'first_screenshot' in milestones:
+    from browser_session import BrowserSession
+    with BrowserSession() as browser:
+        browser.screenshot('<table><tr><td>startup</td></tr></table>', 'startup')
+    mark('first_screenshot')
+"""
+
+
+#%% Benchmark
+
+def run_startup(milestones, cwd=None):
+    cwd = cwd or os.path.dirname(os.path.abspath(__file__))
+    env = dict(os.environ, CASH_DASH_STARTUP_T0=repr(time.time()))
+    result = subprocess.run([sys.executable, '-c', CHILD, *milestones], cwd=cwd, env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"startup run failed:\n{result.stderr[-2000:]}")
+    marks = [json.loads(line[len('startup '):]) for line in result.stdout.splitlines() if line.startswith('startup ')]
+    return {mark['milestone']: mark['seconds'] for mark in marks}
+
+
+# The first run is the cold start a new container sees; later runs show what the OS file cache hides.
+def startup_report(milestones=MILESTONES, repeat=3):
+    runs = [run_startup(milestones) for _ in range(repeat)]
+    return {
+        'timestamp': dt.datetime.now().isoformat(timespec='seconds'),
+        'python': sys.version.split()[0],
+        'first_run': runs[0],
+        'best': {name: min(run[name] for run in runs) for name in runs[0]},
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Time from process launch to the first query, chart, table and screenshot.')
+    parser.add_argument('--milestones', nargs='+', choices=MILESTONES, default=MILESTONES)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', default=RESULTS_FILE)
+    parser.add_argument('--max-seconds', type=float, default=None, help='exit non-zero if the checked milestone of the first run takes longer')
+    parser.add_argument('--check', choices=MILESTONES, default='first_query', help='milestone --max-seconds applies to, the last one measured if it is not')
+    args = parser.parse_args()
+
+    milestones = [name for name in MILESTONES if name in args.milestones or name == 'import']
+    report = startup_report(milestones, args.repeat)
+    with open(args.output, 'a') as f:
+        f.write(json.dumps(report) + '\n')
+    for name, seconds in report['first_run'].items():
+        print(f"{name:<20} first {seconds:>7.3f}s   best {report['best'][name]:>7.3f}s")
+
+    check = args.check if args.check in milestones else milestones[-1]
+    if args.max_seconds is not None and report['first_run'][check] > args.max_seconds:
+        print(f"Cold start regression: {check} took {report['first_run'][check]:.3f}s, over {args.max_seconds:.3f}s")
+        sys.exit(1)